@@ -14,9 +14,11 @@
 """Python wrapper around the VisionBonnet Spicomm device node."""
 
 import array
+import collections
 import fcntl
 import struct
 import sys
+import time
 
 SPICOMM_DEV = '/dev/vision_spicomm'
 
@@ -26,12 +28,25 @@ SPICOMM_IOCTL_TRANSACT = 0xc0100000 + SPICOMM_IOCTL_BASE + 3
 
 HEADER_SIZE = 16
 PAYLOAD_SIZE = 12 * 1024 * 1024  # 12 M
+INITIAL_PAYLOAD_SIZE = 64 * 1024  # 64 K
+SHRINK_AFTER = 30  # seconds
+
+# flags, timeout in ms, total buffer size, filled range of buffer.
+_HEADER = struct.Struct('IIII')
 
 FLAG_ERROR = 1 << 0
 FLAG_TIMEOUT = 1 << 1
 FLAG_OVERFLOW = 1 << 2
 
 
+MemoryStats = collections.namedtuple('MemoryStats', [
+    'buffer_size',       # Current transaction buffer size, bytes.
+    'peak_buffer_size',  # Largest transaction buffer size so far, bytes.
+    'grow_count',        # Number of times the buffer was grown.
+    'shrink_count',      # Number of times the buffer was shrunk.
+])
+
+
 class SpicommError(IOError):
     """Base class for Spicomm errors."""
     pass
@@ -73,14 +88,63 @@ class Spicomm(object):
     point of view. Multiple threads and processes can access the device
     node concurrently using one Spicomm instance per thread.
     Transactions are serialized in the underlying kernel driver.
+
+    The transaction buffer starts small and grows on demand up to
+    max_payload_size, so instances used only for small requests stay cheap.
+    After shrink_after seconds without large transactions it is shrunk back to
+    its initial size.
     """
 
-    def __init__(self):
+    def __init__(self, payload_size=INITIAL_PAYLOAD_SIZE,
+                 max_payload_size=PAYLOAD_SIZE, shrink_after=SHRINK_AFTER):
+        """Opens Spicomm device node.
+
+        Args:
+          payload_size: Initial payload capacity of the transaction buffer.
+          max_payload_size: Payload capacity the buffer may grow to.
+          shrink_after: Seconds without transactions larger than payload_size
+            after which the buffer is shrunk back, None to never shrink.
+        """
         try:
             self._dev = open(SPICOMM_DEV, 'r+b', 0)
         except (IOError, OSError):
             raise SpicommDevNotFoundError
-        self._tbuf = bytearray(HEADER_SIZE + PAYLOAD_SIZE)
+        self._max_payload_size = max_payload_size
+        self._initial_payload_size = min(payload_size, max_payload_size)
+        self._shrink_after = shrink_after
+        self._last_large_time = 0
+        self._peak_buffer_size = 0
+        self._grow_count = 0
+        self._shrink_count = 0
+        self._allocate(self._initial_payload_size)
+
+    def _allocate(self, payload_size):
+        # Views returned by transact_view keep the old buffer alive.
+        self._tbuf = bytearray(HEADER_SIZE + payload_size)
+        self._tview = memoryview(self._tbuf)
+        self._peak_buffer_size = max(self._peak_buffer_size, len(self._tbuf))
+
+    @property
+    def _payload_size(self):
+        return len(self._tbuf) - HEADER_SIZE
+
+    def _grow(self, size):
+        # Double at least to avoid repeated regrowing on slowly rising sizes.
+        self._allocate(min(max(size, 2 * self._payload_size), self._max_payload_size))
+        self._grow_count += 1
+
+    def shrink(self):
+        """Shrinks the transaction buffer back to its initial size."""
+        if self._payload_size > self._initial_payload_size:
+            self._allocate(self._initial_payload_size)
+            self._shrink_count += 1
+
+    def memory_stats(self):
+        """Returns MemoryStats of the transaction buffer."""
+        return MemoryStats(buffer_size=len(self._tbuf),
+                           peak_buffer_size=self._peak_buffer_size,
+                           grow_count=self._grow_count,
+                           shrink_count=self._shrink_count)
 
     def __enter__(self):
         return self
@@ -96,7 +160,9 @@ class Spicomm(object):
         """Execute a Spicomm transaction.
 
         The bytes in request are sent, a response is waited for and returned.
-        If the request or response is too large SpicommOverflowError is raised.
+        If the response does not fit the transaction buffer, the buffer is grown
+        and the request is sent again. If the request or response is larger than
+        the maximum payload size SpicommOverflowError is raised.
 
         Args:
           request: Request bytes to send.
@@ -106,33 +172,79 @@ class Spicomm(object):
           Bytes-like object with response data.
 
         Raises:
-          SpicommOverflowError: Transaction buffer was too small for response.
-                                The 'size' attribute contains the required size.
+          SpicommOverflowError: Transaction buffer could not grow enough for
+                                request or response. The 'size' attribute
+                                contains the required size.
           SpicommTimeoutError : Transaction timed out.
           SpicommInternalError: Unexpected error interacting with kernel driver.
         """
+        return self.transact_view(request, timeout).tobytes()
+
+    def transact_view(self, request, timeout=15):
+        """Execute a Spicomm transaction without copying the response.
+
+        Same as transact, but the response is returned as a memoryview over
+        the internal transaction buffer. The view is invalidated (its contents
+        are overwritten) by the next transact or transact_view call on this
+        instance, so it must be consumed, or copied with bytes(), before that.
+        The view must not be used after close().
+
+        Args:
+          request: Request bytes-like object to send.
+          timeout: How long a response will be waited for, in seconds.
+
+        Returns:
+          memoryview with response data.
+
+        Raises:
+          See transact.
+        """
 
         payload_len = len(request)
-        if payload_len > PAYLOAD_SIZE:
-            raise SpicommOverflowError(PAYLOAD_SIZE)
+        if payload_len > self._max_payload_size:
+            raise SpicommOverflowError(self._max_payload_size)
+
+        now = time.time()
+        if payload_len > self._initial_payload_size:
+            self._last_large_time = now
+        elif (self._shrink_after is not None and
+              now - self._last_large_time > self._shrink_after):
+            self.shrink()
+
+        if payload_len > self._payload_size:
+            self._grow(payload_len)
+
+        while True:
+            try:
+                response = self._transact_view(request, timeout)
+            except SpicommOverflowError as e:
+                if e.size <= self._payload_size or e.size > self._max_payload_size:
+                    raise
+                self._grow(e.size)
+                continue
+
+            if len(response) > self._initial_payload_size:
+                self._last_large_time = now
+            return response
+
+    def _transact_view(self, request, timeout):
+        payload_len = len(request)
 
         # Fill in transaction buffer.
-        self._tbuf[0:4] = struct.pack('I', 0)  # flags, not currently used.
-        self._tbuf[4:8] = struct.pack('I', int(timeout * 1000))  # timeout, ms.
-        self._tbuf[8:12] = struct.pack('I', len(self._tbuf))  # total buffer size.
-        self._tbuf[12:16] = struct.pack('I', payload_len)  # filled range of buffer.
-        self._tbuf[16:16 + payload_len] = request
+        _HEADER.pack_into(self._tbuf, 0, 0, int(timeout * 1000),
+                          len(self._tbuf), payload_len)
+        self._tview[HEADER_SIZE:HEADER_SIZE + payload_len] = request
 
         try:
             # Send transaction to kernel driver.
             fcntl.ioctl(self._dev, SPICOMM_IOCTL_TRANSACT, self._tbuf)
 
             # No exception means errno 0 and self._tbuf is now mutated.
-            _, _, _, payload_len = struct.unpack('IIII', self._tbuf[0:16])
-            return self._tbuf[16:16 + payload_len]
+            _, _, _, payload_len = _HEADER.unpack_from(self._tbuf)
+            return self._tview[HEADER_SIZE:HEADER_SIZE + payload_len]
         except (IOError, OSError):
             # FLAG_ERROR is set if we actually talked to the kernel.
-            flags, _, _, payload_len = struct.unpack('IIII', self._tbuf[0:16])
+            flags, _, _, payload_len = _HEADER.unpack_from(self._tbuf)
             if flags & FLAG_ERROR:
                 if flags & FLAG_TIMEOUT:
                     raise SpicommTimeoutError
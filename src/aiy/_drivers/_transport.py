@@ -22,59 +22,133 @@ import struct
 from aiy._drivers import _spicomm
 
 
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
 class _SpiTransport(object):
-    """Communicate with VisionBonnet over SPI bus."""
+    """Communicate with VisionBonnet over SPI bus.
+
+    The Spicomm transaction buffer is configured with environment variables:
+    VISION_BONNET_INITIAL_PAYLOAD and VISION_BONNET_MAX_PAYLOAD (bytes) and
+    VISION_BONNET_SHRINK_AFTER (seconds, negative to never shrink).
+    """
 
     def __init__(self):
-        self._spicomm = _spicomm.Spicomm()
+        shrink_after = _env_int('VISION_BONNET_SHRINK_AFTER', _spicomm.SHRINK_AFTER)
+        self._spicomm = _spicomm.Spicomm(
+            payload_size=_env_int('VISION_BONNET_INITIAL_PAYLOAD',
+                                  _spicomm.INITIAL_PAYLOAD_SIZE),
+            max_payload_size=_env_int('VISION_BONNET_MAX_PAYLOAD', _spicomm.PAYLOAD_SIZE),
+            shrink_after=shrink_after if shrink_after >= 0 else None)
 
     # TODO(dkovalev): add timeout when implemented in Spicomm
     def send(self, request):
-        return self._spicomm.transact(request)
+        # Response is a view into the Spicomm buffer, valid until next send().
+        return self._spicomm.transact_view(request)
+
+    def memory_stats(self):
+        return self._spicomm.memory_stats()
 
     def close(self):
         self._spicomm.close()
 
 
-def _socket_recvall(s, size):
-    buf = b''
-    while size:
-        newbuf = s.recv(size)
-        if not newbuf:
-            return None
-        buf += newbuf
-        size -= len(newbuf)
-    return buf
+_HEADER = struct.Struct('!I')  # 4 bytes, payload size.
+_INITIAL_RECEIVE_SIZE = 64 * 1024
+
+
+def _socket_recv_into(s, view):
+    """Fills view from the socket, returns False on EOF."""
+    while view:
+        size = s.recv_into(view)
+        if not size:
+            return False
+        view = view[size:]
+    return True
+
+
+class _ReceiveBuffer(object):
+    """Reusable buffer for incoming messages, grows to the largest message."""
 
+    def __init__(self, size=_INITIAL_RECEIVE_SIZE):
+        self._header = bytearray(_HEADER.size)
+        self._buffer = bytearray(size)
+        self._grow_count = 0
 
-def _socket_receive_message(s):
-    buf = _socket_recvall(s, 4)  # 4 bytes
-    if not buf:
-        return None
-    size = struct.unpack('!I', buf)[0]
-    return _socket_recvall(s, size)
+    def memory_stats(self):
+        """Returns MemoryStats, the buffer only grows."""
+        size = len(self._buffer)
+        return _spicomm.MemoryStats(buffer_size=size, peak_buffer_size=size,
+                                    grow_count=self._grow_count, shrink_count=0)
+
+    def receive(self, s):
+        """Returns memoryview of the next message, valid until next receive().
+
+        Returns None if the connection was closed.
+        """
+        if not _socket_recv_into(s, memoryview(self._header)):
+            return None
+        size = _HEADER.unpack(self._header)[0]
+        if size > len(self._buffer):
+            self._buffer = bytearray(max(size, 2 * len(self._buffer)))
+            self._grow_count += 1
+        view = memoryview(self._buffer)[:size]
+        if not _socket_recv_into(s, view):
+            return None
+        return view
 
 
 def _socket_send_message(s, msg):
-    s.sendall(struct.pack('!I', len(msg)))  # 4 bytes
-    s.sendall(msg)  # len(msg) bytes
+    header = _HEADER.pack(len(msg))
+    if not hasattr(s, 'sendmsg'):  # Windows.
+        s.sendall(header + bytes(msg))
+        return
+    # Header and payload in one vectored send, finish partial sends with sendall.
+    sent = s.sendmsg([header, msg])
+    if sent < len(header):
+        s.sendall(header[sent:])
+        sent = len(header)
+    if sent < len(header) + len(msg):
+        s.sendall(memoryview(msg)[sent - len(header):])
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, default).lower() not in ('0', 'false', 'no', '')
 
 
 class _SocketTransport(object):
-    """Communicate with VisionBonnet over socket."""
+    """Communicate with VisionBonnet over socket.
+
+    Connects to VISION_BONNET_SOCKET if set (Unix domain socket path), to
+    VISION_BONNET_HOST:VISION_BONNET_PORT otherwise. TCP_NODELAY is enabled
+    unless VISION_BONNET_NODELAY is 0.
+    """
 
     def __init__(self):
         """Open connection to the bonnet."""
-        self._client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-        host = os.environ.get('VISION_BONNET_HOST', '172.28.28.10')
-        port = int(os.environ.get('VISION_BONNET_PORT', '35000'))
-        self._client.connect((host, port))
+        path = os.environ.get('VISION_BONNET_SOCKET')
+        if path:
+            self._client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._client.connect(path)
+        else:
+            self._client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            if _env_flag('VISION_BONNET_NODELAY', '1'):
+                self._client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            host = os.environ.get('VISION_BONNET_HOST', '172.28.28.10')
+            port = int(os.environ.get('VISION_BONNET_PORT', '35000'))
+            self._client.connect((host, port))
+        self._buffer = _ReceiveBuffer()
 
     # TODO(dkovalev,weiranzhao): add timeout parameter
     def send(self, request):
+        # Response is a view into the receive buffer, valid until next send().
         _socket_send_message(self._client, request)
-        return _socket_receive_message(self._client)
+        return self._buffer.receive(self._client)
+
+    def memory_stats(self):
+        return self._buffer.memory_stats()
 
     def close(self):
         self._client.close()
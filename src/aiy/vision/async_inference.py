@@ -0,0 +1,217 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""asyncio API for the VisionBonnet InferenceEngine.
+
+Wraps the synchronous InferenceEngine so that vision can share one event loop
+with network I/O:
+
+    async with AsyncCameraInference(face_detection.model()) as inference:
+        async for result in inference:
+            faces = face_detection.get_faces(result)
+
+All requests of one AsyncInferenceEngine run on a single worker thread, so
+concurrent coroutines are serialized safely over one transport. Every call
+accepts a timeout in seconds. A cancelled or timed out call stops waiting
+immediately, but a transaction that already started still completes on the
+worker thread before the next queued request is sent.
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+
+from aiy.vision.inference import InferenceEngine
+
+
+class AsyncInferenceEngine(object):
+    """Coroutine-based access to InferenceEngine on VisionBonnet board."""
+
+    def __init__(self, engine=None, loop=None):
+        """Initializes AsyncInferenceEngine.
+
+        Args:
+          engine: InferenceEngine to use, a new one is created if None. A passed
+            engine is not closed by close().
+          loop: asyncio event loop, the current one if None.
+        """
+        self._loop = loop
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._owns_engine = engine is None
+        self._engine = engine or InferenceEngine()
+
+    async def _call(self, timeout, func, *args):
+        loop = self._loop or asyncio.get_event_loop()
+        future = loop.run_in_executor(self._executor, functools.partial(func, *args))
+        return await asyncio.wait_for(future, timeout)
+
+    async def load_model(self, descriptor, timeout=None):
+        """See InferenceEngine.load_model."""
+        return await self._call(timeout, self._engine.load_model, descriptor)
+
+    async def unload_model(self, model_name, timeout=None):
+        """See InferenceEngine.unload_model."""
+        return await self._call(timeout, self._engine.unload_model, model_name)
+
+    async def start_camera_inference(self, model_name, params=None, timeout=None):
+        """See InferenceEngine.start_camera_inference."""
+        return await self._call(timeout, self._engine.start_camera_inference,
+                                model_name, params)
+
+    async def camera_inference(self, timeout=None):
+        """See InferenceEngine.camera_inference."""
+        return await self._call(timeout, self._engine.camera_inference)
+
+    async def stop_camera_inference(self, timeout=None):
+        """See InferenceEngine.stop_camera_inference."""
+        return await self._call(timeout, self._engine.stop_camera_inference)
+
+    async def get_camera_state(self, timeout=None):
+        """See InferenceEngine.get_camera_state."""
+        return await self._call(timeout, self._engine.get_camera_state)
+
+    async def get_firmware_info(self, timeout=None):
+        """See InferenceEngine.get_firmware_info."""
+        return await self._call(timeout, self._engine.get_firmware_info)
+
+    async def image_inference(self, model_name, image, params=None, timeout=None):
+        """See InferenceEngine.image_inference."""
+        return await self._call(timeout, self._engine.image_inference,
+                                model_name, image, params)
+
+    async def close(self):
+        """Waits for pending requests and closes the engine."""
+        if self._owns_engine:
+            await self._call(None, self._engine.close)
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_tb):
+        await self.close()
+
+
+class AsyncCameraInference(object):
+    """Helper class to run camera inference from coroutines.
+
+    Camera inference is started on first use, either by `async with` or by the
+    first iteration of `async for`.
+    """
+
+    def __init__(self, descriptor, params=None, engine=None, timeout=None):
+        """Initializes AsyncCameraInference.
+
+        Args:
+          descriptor: ModelDescriptor of the model to run.
+          params: dict, additional parameters to start camera inference.
+          engine: AsyncInferenceEngine to use, a new one is created if None.
+          timeout: float, timeout in seconds of each request.
+        """
+        self._descriptor = descriptor
+        self._params = params
+        self._owns_engine = engine is None
+        self._engine = engine
+        self._timeout = timeout
+        self._key = None
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        async with self._lock:
+            if self._key is not None:
+                return
+            if self._engine is None:
+                self._engine = AsyncInferenceEngine()
+            key = await self._engine.load_model(self._descriptor, self._timeout)
+            await self._engine.start_camera_inference(key, self._params,
+                                                      self._timeout)
+            self._key = key
+
+    async def camera_state(self):
+        await self.start()
+        return await self._engine.get_camera_state(self._timeout)
+
+    async def close(self):
+        if self._key is not None:
+            await self._engine.stop_camera_inference(self._timeout)
+            await self._engine.unload_model(self._key, self._timeout)
+            self._key = None
+        if self._owns_engine and self._engine:
+            await self._engine.close()
+            self._engine = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await self.start()
+        return await self._engine.camera_inference(self._timeout)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_tb):
+        await self.close()
+
+
+class AsyncImageInference(object):
+    """Helper class to run image inference from coroutines.
+
+    Several run() calls may be awaited concurrently, they are serialized over
+    the engine's transport.
+    """
+
+    def __init__(self, descriptor, engine=None, timeout=None):
+        """Initializes AsyncImageInference.
+
+        Args:
+          descriptor: ModelDescriptor of the model to run.
+          engine: AsyncInferenceEngine to use, a new one is created if None.
+          timeout: float, timeout in seconds of each request.
+        """
+        self._descriptor = descriptor
+        self._owns_engine = engine is None
+        self._engine = engine
+        self._timeout = timeout
+        self._key = None
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        async with self._lock:
+            if self._key is not None:
+                return
+            if self._engine is None:
+                self._engine = AsyncInferenceEngine()
+            self._key = await self._engine.load_model(self._descriptor,
+                                                      self._timeout)
+
+    async def run(self, image, params=None):
+        await self.start()
+        return await self._engine.image_inference(self._key, image, params,
+                                                  self._timeout)
+
+    async def close(self):
+        if self._key is not None:
+            await self._engine.unload_model(self._key, self._timeout)
+            self._key = None
+        if self._owns_engine and self._engine:
+            await self._engine.close()
+            self._engine = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_tb):
+        await self.close()
@@ -0,0 +1,352 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Process-wide InferenceEngine broker.
+
+Multiplexes requests from many threads over a single transport and fans out
+each camera inference result to all subscribers without extra round trips:
+
+    broker = EngineBroker.instance()
+    with broker.subscribe(face_detection.model()) as subscription:
+        for result in subscription.run():
+            ...
+
+    client = broker.client('classifier')
+    model_name = client.load_model(image_classification.model())
+    result = client.image_inference(model_name, image)
+"""
+
+import collections
+import itertools
+import threading
+import time
+
+from aiy.vision.inference import InferenceException
+from aiy.vision.inference import ModelManager
+
+ClientStats = collections.namedtuple('ClientStats', [
+    'name',             # Client name.
+    'requests',         # Number of requests or delivered results.
+    'mean_latency_ms',  # Mean latency of requests or result delivery.
+    'max_latency_ms',   # Max latency of requests or result delivery.
+    'dropped_frames',   # Results discarded because the client was too slow.
+])
+
+
+class _Latency(object):
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def stats(self, name, dropped_frames=0):
+        mean = self.total / self.count if self.count else 0.0
+        return ClientStats(name=name, requests=self.count,
+                           mean_latency_ms=1000 * mean,
+                           max_latency_ms=1000 * self.max,
+                           dropped_frames=dropped_frames)
+
+
+class BrokerClient(object):
+    """Thread-safe handle to the shared engine which records its own latency.
+
+    Latency includes the time spent waiting for requests of other clients.
+    """
+
+    def __init__(self, broker, name):
+        self._broker = broker
+        self._name = name
+        self._latency = _Latency()
+        self._lock = threading.Lock()
+
+    def _call(self, func, *args):
+        start = time.time()
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._latency.add(time.time() - start)
+
+    def load_model(self, descriptor):
+        return self._call(self._broker.manager.load_model, descriptor)
+
+    def image_inference(self, model_name, image, params=None):
+        return self._call(self._broker.engine.image_inference, model_name, image,
+                          params)
+
+    def get_camera_state(self):
+        return self._call(self._broker.engine.get_camera_state)
+
+    def get_firmware_info(self):
+        return self._call(self._broker.engine.get_firmware_info)
+
+    def stats(self):
+        with self._lock:
+            return self._latency.stats(self._name)
+
+
+class Subscription(object):
+    """Receives camera inference results of a shared camera stream."""
+
+    def __init__(self, stream, name, queue_size):
+        self._stream = stream
+        self._name = name
+        self._queue = collections.deque(maxlen=queue_size)
+        self._condition = threading.Condition()
+        self._latency = _Latency()
+        self._dropped_frames = 0
+        self._closed = False
+
+    def _put(self, result, timestamp):
+        with self._condition:
+            if len(self._queue) == self._queue.maxlen:
+                self._dropped_frames += 1
+            self._queue.append((result, timestamp))
+            self._condition.notify_all()
+
+    def _fail(self):
+        with self._condition:
+            self._condition.notify_all()
+
+    def _end(self):
+        """Ends the subscription when its camera stream is stopped."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def get(self, timeout=None):
+        """Returns the next result, None on timeout.
+
+        Raises:
+          Exception raised by the camera stream, if it stopped on error.
+        """
+        with self._condition:
+            deadline = None if timeout is None else time.time() + timeout
+            while not self._queue and not self._closed:
+                if self._stream.error is not None:
+                    raise self._stream.error
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            if not self._queue:
+                return None
+            result, timestamp = self._queue.popleft()
+            self._latency.add(time.time() - timestamp)
+            return result
+
+    def run(self):
+        """Yields results until the subscription is closed."""
+        while True:
+            result = self.get()
+            if result is None:
+                return
+            yield result
+
+    def stats(self):
+        """Returns ClientStats, latency is measured from fetch to delivery."""
+        with self._condition:
+            return self._latency.stats(self._name, self._dropped_frames)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._stream.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+
+class _CameraStream(object):
+    """Pulls camera inference results once and fans them out."""
+
+    def __init__(self, broker, model_name, params):
+        self.model_name = model_name
+        self.params = params
+        self.error = None
+        self._broker = broker
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stopped = False
+        broker.engine.start_camera_inference(model_name, params)
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def subscribe(self, subscription):
+        with self._lock:
+            self._subscribers.append(subscription)
+
+    def has_subscribers(self):
+        with self._lock:
+            return bool(self._subscribers)
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+            last = not self._subscribers
+        self._broker._remove_client(subscription)  # pylint: disable=protected-access
+        if last:
+            self._broker._stream_idle(self)  # pylint: disable=protected-access
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                result = self._broker.engine.camera_inference()
+            except Exception as e:  # pylint: disable=broad-except
+                self.error = e
+                with self._lock:
+                    subscribers = list(self._subscribers)
+                for subscriber in subscribers:
+                    subscriber._fail()  # pylint: disable=protected-access
+                return
+            timestamp = time.time()
+            with self._lock:
+                subscribers = list(self._subscribers)
+            for subscriber in subscribers:
+                subscriber._put(result, timestamp)  # pylint: disable=protected-access
+
+    def stop(self):
+        self._stopped = True
+        self._thread.join()
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, []
+        for subscriber in subscribers:
+            subscriber._end()  # pylint: disable=protected-access
+        if self.error is None:
+            self._broker.engine.stop_camera_inference()
+        self._broker.manager.release(self.model_name)
+
+
+class EngineBroker(object):
+    """Shares one InferenceEngine, and its transport, between threads."""
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        """Returns the process-wide broker, created on first use."""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def __init__(self, engine=None, max_models=None):
+        """Initializes EngineBroker.
+
+        Args:
+          engine: InferenceEngine to share, a new one is created if None.
+          max_models: int, max number of resident models, see ModelManager.
+        """
+        self._manager = ModelManager(engine, max_models)
+        self._lock = threading.Lock()
+        self._stream = None
+        self._clients = []
+
+    @property
+    def manager(self):
+        return self._manager
+
+    @property
+    def engine(self):
+        return self._manager.engine
+
+    def client(self, name=None):
+        """Returns a new BrokerClient."""
+        with self._lock:
+            client = BrokerClient(self, name or self._default_name('client'))
+            self._clients.append(client)
+            return client
+
+    def subscribe(self, descriptor, params=None, name=None, queue_size=1):
+        """Subscribes to camera inference results of the given model.
+
+        The camera stream is started by the first subscriber and stopped when
+        the last one closes its subscription. Only one model can run camera
+        inference at a time.
+
+        Args:
+          descriptor: ModelDescriptor of the model to run.
+          params: dict, additional parameters to start camera inference.
+          name: string, subscriber name used in stats.
+          queue_size: int, number of results buffered for this subscriber,
+            the oldest one is dropped when full.
+        Returns:
+          Subscription.
+        """
+        with self._lock:
+            if self._stream is None:
+                # Pinned while the stream runs, released by _CameraStream.stop.
+                model_name = self._manager.acquire(descriptor)
+                try:
+                    self._stream = _CameraStream(self, model_name, params)
+                except Exception:
+                    self._manager.release(model_name)
+                    raise
+            elif self._stream.model_name != descriptor.name:
+                raise InferenceException(
+                    'Camera inference is already running model "%s".' %
+                    self._stream.model_name)
+            subscription = Subscription(
+                self._stream, name or self._default_name('subscriber'), queue_size)
+            self._clients.append(subscription)
+            self._stream.subscribe(subscription)
+            return subscription
+
+    def _default_name(self, prefix):
+        # Lowest free index, names of closed subscriptions are reused.
+        names = {client._name for client in self._clients}  # pylint: disable=protected-access
+        for index in itertools.count():
+            name = '%s-%d' % (prefix, index)
+            if name not in names:
+                return name
+
+    def _remove_client(self, client):
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+
+    def _stream_idle(self, stream):
+        with self._lock:
+            # Somebody may have subscribed again in the meantime.
+            if self._stream is stream and not stream.has_subscribers():
+                self._stream = None
+                stream.stop()
+
+    def stats(self):
+        """Returns list of ClientStats of all clients and open subscriptions."""
+        with self._lock:
+            clients = list(self._clients)
+        return [client.stats() for client in clients]
+
+    def close(self):
+        with self._lock:
+            stream, self._stream = self._stream, None
+        if stream:
+            stream.stop()
+        self._manager.close()
+        with self._instance_lock:
+            if EngineBroker._instance is self:
+                EngineBroker._instance = None
@@ -0,0 +1,320 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Local VisionBonnet emulator for the socket transport.
+
+Serves length-prefixed protocol_pb2 messages like the real bonnet, so the
+host-side pipeline can run on any machine:
+
+    python3 -m aiy.vision.emulator --port 35000 --latency-ms 40
+
+    VISION_BONNET_HOST=localhost VISION_BONNET_PORT=35000 python3 my_app.py
+
+or, with less overhead, on a Unix domain socket:
+
+    python3 -m aiy.vision.emulator --unix-socket /tmp/bonnet.sock
+
+    VISION_BONNET_SOCKET=/tmp/bonnet.sock python3 my_app.py
+
+Inference results contain synthetic tensors for the bundled models, or
+results replayed from a recording made with aiy.vision.replay.
+"""
+
+import argparse
+import logging
+import os
+import random
+import socket
+import socketserver
+import threading
+import time
+
+from aiy._drivers._transport import _ReceiveBuffer
+from aiy._drivers._transport import _socket_send_message
+from aiy.vision.models import object_detection_anchors
+from aiy.vision.proto import protocol_pb2
+from aiy.vision.replay import read_records
+
+_CAMERA_SIZE = (1640, 1232)
+_FIRMWARE_VERSION = (1, 0)
+# Synthetic results are generated once per model and frame size, then cycled,
+# so that the emulator itself is not the bottleneck of a benchmark.
+_SYNTHETIC_POOL_SIZE = 16
+
+
+def _softmax_tensor(result, name, depth, rand):
+    tensor = result.tensors[name]
+    tensor.shape.batch, tensor.shape.height, tensor.shape.width = 1, 1, 1
+    tensor.shape.depth = depth
+    probs = [rand.random() ** 8 for _ in range(depth)]
+    total = sum(probs)
+    tensor.data.extend(p / total for p in probs)
+
+
+def _object_detection_tensors(result, rand):
+    num_anchors = object_detection_anchors.num_anchors()
+    # Mostly background, with a few confident detections.
+    logits = [-4.0] * (4 * num_anchors)
+    for i in range(num_anchors):
+        logits[4 * i] = 4.0
+    for i in rand.sample(range(num_anchors), 5):
+        logits[4 * i] = -4.0
+        logits[4 * i + rand.randint(1, 3)] = rand.uniform(0.0, 4.0)
+    result.tensors['concat_1'].data.extend(logits)
+    result.tensors['concat'].data.extend(rand.gauss(0.0, 0.5)
+                                         for _ in range(4 * num_anchors))
+
+
+def _face_detection_tensors(result, rand):
+    num_faces = rand.randint(0, 3)
+    for _ in range(num_faces):
+        x, y = rand.uniform(0, result.width - 100), rand.uniform(0, result.height - 100)
+        size = rand.uniform(50, 100)
+        result.tensors['bounding_boxes'].data.extend((x, y, size, size))
+        result.tensors['face_scores'].data.append(rand.uniform(0.5, 1.0))
+        result.tensors['joy_scores'].data.append(rand.random())
+    for name in ('bounding_boxes', 'face_scores', 'joy_scores'):
+        result.tensors[name].SetInParent()
+
+
+def _synthetic_tensors(result, rand):
+    name = result.model_name
+    if name == 'object_detection':
+        _object_detection_tensors(result, rand)
+    elif name == 'FaceDetection':
+        _face_detection_tensors(result, rand)
+    elif name == 'image_classification_mobilenet':
+        _softmax_tensor(result, 'MobilenetV1/Predictions/Softmax', 1001, rand)
+    elif name == 'image_classification_squeezenet':
+        _softmax_tensor(result, 'Prediction', 1001, rand)
+    elif name == 'dish_classifier':
+        _softmax_tensor(result, 'MobilenetV1/Predictions/Softmax', 2024, rand)
+    else:
+        _softmax_tensor(result, 'output', 10, rand)
+
+
+class EmulatorError(Exception):
+    pass
+
+
+class _Bonnet(object):
+    """Emulated bonnet state shared by all connections."""
+
+    def __init__(self, latency_ms, fps, replay_path, seed):
+        self._latency = latency_ms / 1000.0
+        self._frame_interval = 1.0 / fps if fps else 0.0
+        self._replay = {}
+        if replay_path:
+            for _, _, data in read_records(replay_path):
+                result = protocol_pb2.InferenceResult()
+                result.ParseFromString(data)
+                self._replay.setdefault(result.model_name, []).append(result)
+        self._synthetic = {}
+        self._result_index = {}
+        self._rand = random.Random(seed)
+        self._lock = threading.Lock()
+        self._models = {}
+        self._camera_model = None
+        self._frame_index = 0
+        self._last_frame_time = 0.0
+
+    def _synthetic_results(self, model_name, width, height):
+        key = (model_name, width, height)
+        results = self._synthetic.get(key)
+        if results is None:
+            results = []
+            for _ in range(_SYNTHETIC_POOL_SIZE):
+                result = protocol_pb2.InferenceResult(model_name=model_name,
+                                                      width=width, height=height)
+                result.window.width, result.window.height = width, height
+                _synthetic_tensors(result, self._rand)
+                results.append(result)
+            self._synthetic[key] = results
+        return results
+
+    def _result(self, model_name, width, height):
+        results = (self._replay.get(model_name) or
+                   self._synthetic_results(model_name, width, height))
+        index = self._result_index.get(model_name, 0)
+        self._result_index[model_name] = index + 1
+        result = protocol_pb2.InferenceResult()
+        result.CopyFrom(results[index % len(results)])
+        return result
+
+    def _load_model(self, request, response):
+        name = request.model_name
+        if name in self._models:
+            raise EmulatorError('Model "%s" is already loaded.' % name)
+        self._models[name] = request.input_shape
+
+    def _unload_model(self, request, response):
+        if self._models.pop(request.model_name, None) is None:
+            raise EmulatorError('Model "%s" is not loaded.' % request.model_name)
+
+    def _image_inference(self, request, response):
+        if request.model_name not in self._models:
+            raise EmulatorError('Model "%s" is not loaded.' % request.model_name)
+        shape = request.tensor.shape
+        result = self._result(request.model_name, shape.width, shape.height)
+        result.duration_ms = int(1000 * self._latency)
+        response.inference_result.CopyFrom(result)
+
+    def _start_camera_inference(self, request, response):
+        if request.model_name not in self._models:
+            raise EmulatorError('Model "%s" is not loaded.' % request.model_name)
+        if self._camera_model:
+            raise EmulatorError('Camera inference is already running.')
+        self._camera_model = request.model_name
+
+    def _camera_inference(self, request, response):
+        if not self._camera_model:
+            raise EmulatorError('Camera inference is not running.')
+        # Emulate camera frame rate.
+        delay = self._last_frame_time + self._frame_interval - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        self._last_frame_time = time.time()
+        self._frame_index += 1
+
+        result = self._result(self._camera_model, *_CAMERA_SIZE)
+        result.duration_ms = int(1000 * self._latency)
+        result.frame.index = self._frame_index
+        result.frame.timestamp_us = int(self._last_frame_time * 1e6)
+        response.inference_result.CopyFrom(result)
+
+    def _stop_camera_inference(self, request, response):
+        if not self._camera_model:
+            raise EmulatorError('Camera inference is not running.')
+        self._camera_model = None
+
+    def _get_camera_state(self, request, response):
+        response.camera_state.running = bool(self._camera_model)
+        response.camera_state.width, response.camera_state.height = _CAMERA_SIZE
+
+    def _get_firmware_info(self, request, response):
+        info = response.firmware_info
+        info.major_version, info.minor_version = _FIRMWARE_VERSION
+
+    def handle(self, data):
+        """Returns serialized Response to serialized Request."""
+        request = protocol_pb2.Request()
+        request.ParseFromString(data)
+        response = protocol_pb2.Response()
+        kind = request.WhichOneof('request')
+        handler = getattr(self, '_' + kind, None) if kind else None
+        try:
+            if handler is None:
+                raise EmulatorError('Unsupported request: %s' % kind)
+            if self._latency:
+                time.sleep(self._latency)
+            with self._lock:
+                handler(getattr(request, kind), response)
+            response.status.code = protocol_pb2.Response.Status.OK
+        except EmulatorError as e:
+            response.Clear()
+            response.status.code = protocol_pb2.Response.Status.ERROR
+            response.status.message = str(e)
+        return response.SerializeToString()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def setup(self):
+        if self.request.family != socket.AF_UNIX:
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        buffer = _ReceiveBuffer()
+        while True:
+            data = buffer.receive(self.request)
+            if data is None:
+                return
+            _socket_send_message(self.request, self.server.bonnet.handle(data))
+
+
+class _EmulatorMixIn(socketserver.ThreadingMixIn):
+
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=0, fps=30, replay_path=None, seed=None):
+        self.bonnet = _Bonnet(latency_ms, fps, replay_path, seed)
+        self.server_class.__init__(self, address, _Handler)
+
+
+class BonnetEmulator(_EmulatorMixIn, socketserver.TCPServer):
+    """TCP server emulating VisionBonnet.
+
+    Args:
+      address: (host, port) to listen on.
+      latency_ms: float, delay added to every request.
+      fps: float, max camera inference rate, None for no limit.
+      replay_path: string, recording to take inference results from,
+        synthetic results are used for models it does not contain.
+      seed: random seed of synthetic results.
+    """
+
+    server_class = socketserver.TCPServer
+    allow_reuse_address = True
+
+
+class UnixBonnetEmulator(_EmulatorMixIn, socketserver.UnixStreamServer):
+    """Unix domain socket server emulating VisionBonnet.
+
+    Same arguments as BonnetEmulator, address is the socket path. Clients
+    connect to it with VISION_BONNET_SOCKET=<path>.
+    """
+
+    server_class = socketserver.UnixStreamServer
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='VisionBonnet emulator.')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=35000)
+    parser.add_argument('--unix-socket', default=None,
+                        help='Listen on this Unix domain socket path instead of TCP.')
+    parser.add_argument('--latency-ms', type=float, default=0,
+                        help='Delay added to every request.')
+    parser.add_argument('--fps', type=float, default=30,
+                        help='Camera inference frame rate, 0 for no limit.')
+    parser.add_argument('--replay', default=None,
+                        help='Recording to take inference results from.')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Random seed of synthetic results.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.unix_socket:
+        server = UnixBonnetEmulator(args.unix_socket, args.latency_ms, args.fps,
+                                    args.replay, args.seed)
+        logging.info('VisionBonnet emulator listening on %s', server.server_address)
+    else:
+        server = BonnetEmulator((args.host, args.port), args.latency_ms, args.fps,
+                                args.replay, args.seed)
+        logging.info('VisionBonnet emulator listening on %s:%d',
+                     *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
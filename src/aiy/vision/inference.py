@@ -21,14 +21,154 @@ deleted. See image_classification.py and object_recognition.py as examples on
 how to use this API.
 """
 
+import collections
+import concurrent.futures
 import logging
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 from aiy._drivers._transport import make_transport
+from aiy.vision import telemetry
 from aiy.vision.proto import protocol_pb2
 
 
 _SUPPORTED_FIRMWARE_VERSION = (1, 0)  # major, minor
 
 
+def _serialized_request(name):
+    """Returns serialized request with an empty sub-message `name` set."""
+    request = protocol_pb2.Request()
+    getattr(request, name).SetInParent()
+    return request.SerializeToString()
+
+
+# Requests without parameters are serialized once and reused.
+_CAMERA_INFERENCE_REQUEST = _serialized_request('camera_inference')
+_STOP_CAMERA_INFERENCE_REQUEST = _serialized_request('stop_camera_inference')
+_GET_CAMERA_STATE_REQUEST = _serialized_request('get_camera_state')
+_GET_FIRMWARE_INFO_REQUEST = _serialized_request('get_firmware_info')
+
+
+def _varint(value):
+    """Returns protobuf varint encoding of non-negative int value."""
+    data = bytearray()
+    while value > 0x7f:
+        data.append((value & 0x7f) | 0x80)
+        value >>= 7
+    data.append(value)
+    return bytes(data)
+
+
+# Wire tags of Request.load_model (field 1) and LoadModel.compute_graph
+# (field 4), both length-delimited.
+_LOAD_MODEL_TAG = b'\x0a'
+_COMPUTE_GRAPH_TAG = b'\x22'
+
+
+def _load_model_request(load_model, compute_graph):
+    """Returns serialized load_model request with compute_graph attached.
+
+    The graph is written after the other LoadModel fields instead of being
+    assigned to the message, so large graphs are copied only once, into the
+    joined bytes. The result is the same as serializing the full request.
+
+    Args:
+      load_model: protocol_pb2.LoadModel with everything but compute_graph set.
+      compute_graph: bytes, converted model proto.
+    """
+    inner = load_model.SerializeToString()
+    graph_field = _COMPUTE_GRAPH_TAG + _varint(len(compute_graph))
+    size = len(inner) + len(graph_field) + len(compute_graph)
+    return b''.join((_LOAD_MODEL_TAG, _varint(size), inner, graph_field,
+                     compute_graph))
+
+
+# Wire tags of Request.image_inference (field 3), ImageInference.tensor
+# (field 2) and ByteTensor.data (field 2), all length-delimited.
+_IMAGE_INFERENCE_TAG = b'\x1a'
+_TENSOR_TAG = b'\x12'
+_TENSOR_DATA_TAG = b'\x12'
+
+
+# Pixels are read from the image in strips of about this many bytes, so the
+# only full-size copy is the request buffer itself.
+_PACK_STRIP_SIZE = 1024 * 1024
+
+
+def _pack_pixels(image, view):
+    """Writes image pixels into view, RGB images as planar R, G, B."""
+    width, height = image.size
+    depth = len(image.mode)
+    plane_size = width * height
+    if np is not None and depth == 3:
+        planes = np.frombuffer(view, dtype=np.uint8).reshape(3, height, width)
+    rows = max(_PACK_STRIP_SIZE // (width * depth), 1)
+    for top in range(0, height, rows):
+        bottom = min(top + rows, height)
+        strip = image.crop((0, top, width, bottom)).tobytes()
+        start, end = top * width, bottom * width
+        if depth == 1:
+            view[start:end] = strip
+        elif np is not None:
+            pixels = np.frombuffer(strip, dtype=np.uint8).reshape(bottom - top, width, 3)
+            np.copyto(planes[:, top:bottom], pixels.transpose(2, 0, 1))
+        else:
+            for channel in range(3):
+                offset = channel * plane_size
+                view[offset + start:offset + end] = strip[channel::3]
+
+
+def _image_inference_request(image_inference, image, buffer):
+    """Returns serialized image_inference request with image pixels attached.
+
+    The pixels are packed straight into the buffer, between the serialized
+    fields that precede and follow ByteTensor.data. The result is the same as
+    serializing the full request.
+
+    Args:
+      image_inference: protocol_pb2.ImageInference with everything but tensor
+        data set.
+      image: PIL.Image in L or RGB mode.
+      buffer: bytearray to reuse, a bigger one is allocated if it is too small.
+
+    Returns:
+      (memoryview of the serialized request, buffer).
+    """
+    if image.mode not in ('L', 'RGB'):
+        raise InferenceException('Unsupported image format: %s. Must be L or RGB.' % image.mode)
+    width, height = image.size
+    size = width * height * len(image.mode)
+
+    # Fields in serialization order: model_name, tensor (shape, data), params.
+    message_type = type(image_inference)
+    model_name = message_type(model_name=image_inference.model_name).SerializeToString()
+    shape = image_inference.tensor.SerializeToString()
+    params = message_type()
+    params.params.update(image_inference.params)
+    params = params.SerializeToString()
+
+    data_field = _TENSOR_DATA_TAG + _varint(size)
+    tensor_size = len(shape) + len(data_field) + size
+    tensor = _TENSOR_TAG + _varint(tensor_size)
+    inner_size = len(model_name) + len(tensor) + tensor_size + len(params)
+    header = b''.join((_IMAGE_INFERENCE_TAG, _varint(inner_size), model_name,
+                       tensor, shape, data_field))
+
+    total = len(header) + size + len(params)
+    if buffer is None or len(buffer) < total:
+        buffer = bytearray(total)
+    view = memoryview(buffer)
+    view[:len(header)] = header
+    _pack_pixels(image, view[len(header):len(header) + size])
+    view[len(header) + size:total] = params
+    return view[:total], buffer
+
+
 class FirmwareVersionException(Exception):
 
     def __init__(self, *args, **kwargs):
@@ -60,25 +200,266 @@ def _check_firmware_info(info):
             supported_version, firmware_version)
 
 
+PipelineStats = collections.namedtuple('PipelineStats', [
+    'queue_depth',     # Number of prefetched results waiting for the consumer.
+    'dropped_frames',  # Number of prefetched results discarded as stale.
+    'fps',             # Results delivered to the consumer per second.
+])
+
+
+class _Prefetcher(object):
+    """Fetches results on a background thread into a bounded queue."""
+
+    def __init__(self, fetch, size, policy):
+        self._fetch = fetch
+        self._size = size
+        self._policy = policy
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._error = None
+        self._stopped = False
+        self.dropped_frames = 0
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                result = self._fetch()
+            except Exception as e:  # pylint: disable=broad-except
+                with self._condition:
+                    self._error = e
+                    self._condition.notify_all()
+                return
+
+            with self._condition:
+                if self._policy == CameraInference.BLOCK:
+                    while len(self._queue) >= self._size and not self._stopped:
+                        self._condition.wait()
+                if self._stopped:
+                    return
+                if len(self._queue) >= self._size:
+                    self._queue.popleft()
+                    self.dropped_frames += 1
+                self._queue.append(result)
+                self._condition.notify_all()
+
+    def get(self):
+        with self._condition:
+            while not self._queue and self._error is None:
+                self._condition.wait()
+            if not self._queue:
+                raise self._error
+            result = self._queue.popleft()
+            self._condition.notify_all()
+            return result
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._queue.clear()
+            self._condition.notify_all()
+        self._thread.join()
+
+
+RateStats = collections.namedtuple('RateStats', [
+    'interval_ms',  # Current target interval between results.
+    'consumer_ms',  # Smoothed time the consumer spends on each result.
+    'fps',          # Achieved frame rate in camera time.
+])
+
+
+class RateController(object):
+    """Throttles camera inference to a target frame rate or CPU budget.
+
+    Before each camera inference request the controller sleeps, so that
+    requests start at least 1 / target_fps apart, and the consumer spends at
+    most cpu_budget of the wall time processing results. Requests are
+    scheduled against a deadline, the start of the previous request plus the
+    interval, so the request round trip is part of the interval. Consumer time
+    is measured and smoothed, so a slow consumer automatically backs off.
+    Achieved frame rate is measured with frame.timestamp_us, i.e. in camera
+    time.
+
+    Usage, the way CameraInference.run does it:
+
+        while True:
+            rate.start_request()
+            result = engine.camera_inference()
+            start = time.time()
+            process(result)
+            time.sleep(rate.delay(result, time.time() - start))
+    """
+
+    def __init__(self, target_fps=None, cpu_budget=None, smoothing=0.3):
+        """Initializes RateController.
+
+        Args:
+          target_fps: float, max number of results per second, None for no limit.
+          cpu_budget: float in (0, 1], max fraction of time the consumer may
+            spend processing results, None for no limit.
+          smoothing: float in (0, 1], weight of the latest consumer time
+            measurement in the moving average.
+        """
+        if target_fps is not None and target_fps <= 0:
+            raise ValueError('target_fps must be positive')
+        if cpu_budget is not None and not 0 < cpu_budget <= 1:
+            raise ValueError('cpu_budget must be in the range (0..1]')
+        self._min_interval = 1.0 / target_fps if target_fps else 0.0
+        self._cpu_budget = cpu_budget
+        self._smoothing = smoothing
+        self._consumer_time = None
+        self._request_time = None
+        self._timestamps = collections.deque(maxlen=30)
+
+    @property
+    def interval(self):
+        """Target interval between results, in seconds."""
+        interval = self._min_interval
+        if self._cpu_budget and self._consumer_time:
+            interval = max(interval, self._consumer_time / self._cpu_budget)
+        return interval
+
+    def start_request(self):
+        """Records that a camera inference request is being sent now."""
+        self._request_time = time.time()
+
+    def delay(self, result, consumer_time):
+        """Returns how long to wait before requesting the next result.
+
+        Args:
+          result: InferenceResult just processed by the consumer.
+          consumer_time: float, seconds the consumer spent on result.
+        """
+        if self._consumer_time is None:
+            self._consumer_time = consumer_time
+        else:
+            self._consumer_time += self._smoothing * (consumer_time - self._consumer_time)
+        self._timestamps.append(result.frame.timestamp_us)
+
+        if self._request_time is None:
+            return max(self.interval - consumer_time, 0.0)
+        return max(self._request_time + self.interval - time.time(), 0.0)
+
+    def stats(self):
+        """Returns RateStats."""
+        timestamps = self._timestamps
+        fps = 0.0
+        if len(timestamps) > 1 and timestamps[-1] > timestamps[0]:
+            fps = 1e6 * (len(timestamps) - 1) / (timestamps[-1] - timestamps[0])
+        return RateStats(interval_ms=1000 * self.interval,
+                         consumer_ms=1000 * (self._consumer_time or 0.0),
+                         fps=fps)
+
+
 class CameraInference(object):
     """Helper class to run camera inference."""
 
-    def __init__(self, descriptor, params=None):
-        self._engine = InferenceEngine()
-        self._key = self._engine.load_model(descriptor)
-        self._engine.start_camera_inference(self._key, params)
+    # Prefetch queue policies.
+    DROP_OLDEST = 'drop_oldest'  # Latest frame wins, stale results are dropped.
+    BLOCK = 'block'              # Background thread waits for the consumer.
+
+    def __init__(self, descriptor, params=None, manager=None):
+        """Loads model and starts camera inference.
+
+        Args:
+          descriptor: ModelDescriptor of the model to run.
+          params: dict, additional parameters to start camera inference.
+          manager: ModelManager to share the engine and keep the model resident
+            after close, None to use a private engine. The model is pinned,
+            so the manager does not evict it until close.
+        """
+        self._manager = manager
+        if manager:
+            self._engine = manager.engine
+            self._key = manager.acquire(descriptor)
+        else:
+            self._engine = InferenceEngine()
+            self._key = self._engine.load_model(descriptor)
+        try:
+            self._engine.start_camera_inference(self._key, params)
+        except Exception:
+            self._release()
+            raise
+        self._prefetcher = None
+        self._times = collections.deque(maxlen=30)
 
     def camera_state(self):
         return self._engine.get_camera_state()
 
-    def run(self):
-        while True:
-            yield self._engine.camera_inference()
+    def run(self, prefetch=0, policy=DROP_OLDEST, rate=None):
+        """Yields camera inference results.
+
+        Args:
+          prefetch: int, when positive, results are fetched by a background
+            thread into a queue of this size, so that transfer and parsing
+            overlap with the consumer's own per-frame work.
+          policy: DROP_OLDEST or BLOCK, what the background thread does when
+            the queue is full.
+          rate: RateController to throttle requests with, cannot be combined
+            with prefetch.
+        """
+        if prefetch and rate:
+            raise ValueError('prefetch and rate cannot be used together')
+
+        self._stop_prefetcher()
+        self._times.clear()
+        if not prefetch:
+            self._prefetcher = None
+            while True:
+                if rate:
+                    rate.start_request()
+                result = self._engine.camera_inference()
+                self._times.append(time.time())
+                start = time.time()
+                yield result
+                if rate:
+                    delay = rate.delay(result, time.time() - start)
+                    if delay:
+                        time.sleep(delay)
+
+        self._prefetcher = _Prefetcher(self._engine.camera_inference, prefetch,
+                                       policy)
+        try:
+            while True:
+                result = self._prefetcher.get()
+                self._times.append(time.time())
+                yield result
+        finally:
+            self._stop_prefetcher()
+
+    def stats(self):
+        """Returns PipelineStats of the current run."""
+        times, prefetcher = self._times, self._prefetcher
+        fps = 0.0
+        if len(times) > 1 and times[-1] > times[0]:
+            fps = (len(times) - 1) / (times[-1] - times[0])
+        return PipelineStats(
+            queue_depth=prefetcher.queue_depth if prefetcher else 0,
+            dropped_frames=prefetcher.dropped_frames if prefetcher else 0,
+            fps=fps)
+
+    def _stop_prefetcher(self):
+        # Stopped prefetcher is kept around to report stats of the last run.
+        if self._prefetcher:
+            self._prefetcher.stop()
+
+    def _release(self):
+        if self._manager:
+            self._manager.release(self._key)
+        else:
+            self._engine.unload_model(self._key)
+            self._engine.close()
 
     def close(self):
+        self._stop_prefetcher()
         self._engine.stop_camera_inference()
-        self._engine.unload_model(self._key)
-        self._engine.close()
+        self._release()
 
     def __enter__(self):
         return self
@@ -87,19 +468,167 @@ class CameraInference(object):
         self.close()
 
 
+BatchStats = collections.namedtuple('BatchStats', [
+    'images',             # Number of results delivered.
+    'images_per_sec',     # Results delivered per second.
+    'mean_prepare_ms',    # Mean host-side decode and packing time per image.
+    'mean_inference_ms',  # Mean transfer and VisionBonnet time per image.
+])
+
+
+class _BatchCounter(object):
+
+    def __init__(self):
+        self.start = time.time()
+        self.images = 0
+        self.prepare_time = 0.0
+        self.inference_time = 0.0
+
+    def add(self, prepare_time, inference_time):
+        self.images += 1
+        self.prepare_time += prepare_time
+        self.inference_time += inference_time
+
+    def stats(self):
+        elapsed = time.time() - self.start
+        count = self.images or 1
+        return BatchStats(images=self.images,
+                          images_per_sec=self.images / elapsed if elapsed else 0.0,
+                          mean_prepare_ms=1000 * self.prepare_time / count,
+                          mean_inference_ms=1000 * self.inference_time / count)
+
+
+def _downscale(image, max_size):
+    """Returns image resized to fit into max_size, keeping aspect ratio.
+
+    Images that already fit are returned as is.
+    """
+    width, height = image.size
+    scale = min(max_size[0] / width, max_size[1] / height)
+    if scale >= 1.0:
+        return image
+    from PIL import Image  # Only needed when downscaling.
+    size = (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+    return image.resize(size, Image.BILINEAR)
+
+
+def _rescale_result(result, size):
+    """Maps InferenceResult of a downscaled image back to original image size."""
+    scale_x, scale_y = size[0] / result.width, size[1] / result.height
+    window = result.window
+    window.x = int(round(window.x * scale_x))
+    window.y = int(round(window.y * scale_y))
+    window.width = int(round(window.width * scale_x))
+    window.height = int(round(window.height * scale_y))
+    result.width, result.height = size
+
+
 class ImageInference(object):
     """Helper class to run image inference."""
 
-    def __init__(self, descriptor):
-        self._engine = InferenceEngine()
-        self._key = self._engine.load_model(descriptor)
+    def __init__(self, descriptor, manager=None, downscale=None):
+        """Loads model.
+
+        Args:
+          descriptor: ModelDescriptor of the model to run.
+          manager: ModelManager to share the engine and keep the model resident
+            after close, None to use a private engine. The model is pinned,
+            so the manager does not evict it until close.
+          downscale: int, opt-in host-side downscaling. Images larger than
+            `downscale` times the model input size are resized to fit it before
+            they are sent, and result sizes are scaled back, so decoded boxes are
+            in original image coordinates. Ignored for models without fixed
+            input size (e.g. face detection).
+        """
+        self._manager = manager
+        if manager:
+            self._engine = manager.engine
+            self._key = manager.acquire(descriptor)
+        else:
+            self._engine = InferenceEngine()
+            self._key = self._engine.load_model(descriptor)
+
+        _, height, width, _ = descriptor.input_shape
+        if downscale and width and height:
+            self._max_size = (downscale * width, downscale * height)
+        else:
+            self._max_size = None
+        self._batch = _BatchCounter()
 
     def run(self, image, params=None):
-        return self._engine.image_inference(self._key, image, params)
+        if not self._max_size:
+            return self._engine.image_inference(self._key, image, params)
+
+        scaled = _downscale(image, self._max_size)
+        result = self._engine.image_inference(self._key, scaled, params)
+        if scaled is not image:
+            _rescale_result(result, image.size)
+        return result
+
+    def _prepare(self, image, params):
+        """Decodes, downscales and packs image on a worker thread."""
+        start = time.time()
+        if not hasattr(image, 'size'):
+            from PIL import Image  # Only needed to decode image files.
+            with Image.open(image) as f:
+                image = f.convert('RGB')
+        scaled = _downscale(image, self._max_size) if self._max_size else image
+        data, buffer = self._engine._image_inference_request(self._key, scaled, params)
+        size = image.size if scaled is not image else None
+        return data, buffer, size, time.time() - start
+
+    def run_many(self, images, params=None, workers=1, prefetch=2):
+        """Yields inference results of images, in order.
+
+        Decoding and packing of the next images runs on worker threads while
+        VisionBonnet works on the current one.
+
+        Args:
+          images: iterable of PIL.Image or image file paths.
+          params: dict, additional parameters to run inference.
+          workers: int, number of threads preparing images.
+          prefetch: int, max number of images prepared ahead of the one being
+            processed, bounds memory use.
+        """
+        stats = self._batch = _BatchCounter()
+        pending = collections.deque()
+        images = iter(images)
+        end = object()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                while True:
+                    while len(pending) <= prefetch:
+                        image = next(images, end)
+                        if image is end:
+                            break
+                        pending.append(executor.submit(self._prepare, image, params))
+                    if not pending:
+                        return
+
+                    data, buffer, size, prepare_time = pending.popleft().result()
+                    start = time.time()
+                    try:
+                        result = self._engine._inference_result(data, 'image_inference')
+                    finally:
+                        self._engine._release_buffer(buffer)
+                    if size:
+                        _rescale_result(result, size)
+                    stats.add(prepare_time, time.time() - start)
+                    yield result
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def stats(self):
+        """Returns BatchStats of the latest run_many call."""
+        return self._batch.stats()
 
     def close(self):
-        self._engine.unload_model(self._key)
-        self._engine.close()
+        if self._manager:
+            self._manager.release(self._key)
+        else:
+            self._engine.unload_model(self._key)
+            self._engine.close()
 
     def __enter__(self):
         return self
@@ -162,9 +691,23 @@ class InferenceEngine(object):
 
     def __init__(self):
         self._transport = make_transport()
+        # Serializes requests when the engine is shared by several threads.
+        self._lock = threading.Lock()
+        # Reused for every request, see _communicate.
+        self._response = protocol_pb2.Response()
+        # Firmware info is fetched and checked once per transport session.
+        self._firmware_info = None
+        self._firmware_checked = False
+        # Pixel buffers reused by image_inference, one per concurrent call.
+        self._image_buffers = []
         logging.info('InferenceEngine transport: %s',
                      self._transport.__class__.__name__)
 
+    def memory_stats(self):
+        """Returns MemoryStats of the transport's transaction buffer."""
+        with self._lock:
+            return self._transport.memory_stats()
+
     def close(self):
         self._transport.close()
 
@@ -174,20 +717,53 @@ class InferenceEngine(object):
     def __exit__(self, exc_type, exc_value, exc_tb):
         self.close()
 
-    def _communicate(self, request):
+    def _communicate(self, request, field=None, kind=None):
         """Gets response and logs messages if need to.
 
+        The transport may return a view into its own buffer, so the response
+        bytes are parsed before the next request is sent.
+
+        All responses are parsed into one Response object which is cleared
+        before each parse. Clearing detaches previously returned sub-messages,
+        so they stay valid, but the Response itself must not be used once the
+        lock is released. Hence the sub-message is picked here.
+
         Args:
-          request: protocol_pb2.Request
+          request: protocol_pb2.Request or its serialized bytes-like object.
+          field: string, name of the Response field to return.
+          kind: string, request type name used by telemetry, required for
+            serialized requests.
 
         Returns:
-          protocol_pb2.Response
+          Response field value, or None if field is None.
         """
-        response = protocol_pb2.Response()
-        response.ParseFromString(self._transport.send(request.SerializeToString()))
-        if response.status.code != protocol_pb2.Response.Status.OK:
-            raise InferenceException(response.status.message)
-        return response
+        if isinstance(request, protocol_pb2.Request):
+            kind = kind or request.WhichOneof('request')
+            request = request.SerializeToString()
+        with self._lock:
+            response = self._response
+            start = time.time()
+            data = self._transport.send(request)
+            received = time.time()
+            response.Clear()
+            response.MergeFromString(data)
+            if telemetry.is_enabled():
+                telemetry.record('transport.%s' % kind, received - start)
+                telemetry.record('parse.%s' % kind, time.time() - received)
+            if response.status.code != protocol_pb2.Response.Status.OK:
+                raise InferenceException(response.status.message)
+            return getattr(response, field) if field else None
+
+    def _inference_result(self, request, kind):
+        result = self._communicate(request, 'inference_result', kind)
+        if telemetry.is_enabled():
+            telemetry.record('bonnet.%s' % result.model_name, result.duration_ms / 1000.0)
+        return result
+
+    def _check_firmware(self):
+        if not self._firmware_checked:
+            _check_firmware_info(self.get_firmware_info())
+            self._firmware_checked = True
 
     def load_model(self, descriptor):
         """Loads model on VisionBonnet.
@@ -198,8 +774,21 @@ class InferenceEngine(object):
         Returns:
           Model identifier.
         """
-        _check_firmware_info(self.get_firmware_info())
+        self._check_firmware()
+        return self._load_model(descriptor)
+
+    def load_models(self, descriptors):
+        """Loads several models on VisionBonnet.
+
+        Args:
+          descriptors: iterable of ModelDescriptor.
+        Returns:
+          List of model identifiers.
+        """
+        self._check_firmware()
+        return [self._load_model(descriptor) for descriptor in descriptors]
 
+    def _load_model(self, descriptor, ignore_errors=True):
         logging.info('Loading model "%s"...', descriptor.name)
 
         batch, height, width, depth = descriptor.input_shape
@@ -219,11 +808,13 @@ class InferenceEngine(object):
         request.load_model.input_normalizer.mean = mean
         request.load_model.input_normalizer.stddev = stddev
         if descriptor.compute_graph:
-            request.load_model.compute_graph = descriptor.compute_graph
+            request = _load_model_request(request.load_model, descriptor.compute_graph)
 
         try:
-            self._communicate(request)
+            self._communicate(request, kind='load_model')
         except InferenceException as e:
+            if not ignore_errors:
+                raise
             logging.warning(str(e))
 
         return descriptor.name
@@ -252,31 +843,64 @@ class InferenceEngine(object):
 
     def camera_inference(self):
         """Returns the latest inference result from VisionBonnet."""
-        request = protocol_pb2.Request()
-        request.camera_inference.SetInParent()
-        return self._communicate(request).inference_result
+        return self._inference_result(_CAMERA_INFERENCE_REQUEST, 'camera_inference')
 
     def stop_camera_inference(self):
         """Stops inference running on VisionBonnet."""
-        request = protocol_pb2.Request()
-        request.stop_camera_inference.SetInParent()
-        self._communicate(request)
+        self._communicate(_STOP_CAMERA_INFERENCE_REQUEST, kind='stop_camera_inference')
 
     def get_camera_state(self):
-        request = protocol_pb2.Request()
-        request.get_camera_state.SetInParent()
-        return self._communicate(request).camera_state
+        return self._communicate(_GET_CAMERA_STATE_REQUEST, 'camera_state',
+                                 'get_camera_state')
 
     def get_firmware_info(self):
-        """Returns firmware version as (major, minor) tuple."""
+        """Returns firmware version as (major, minor) tuple.
+
+        The version is requested from VisionBonnet once and then cached.
+        """
+        if self._firmware_info is None:
+            try:
+                info = self._communicate(_GET_FIRMWARE_INFO_REQUEST, 'firmware_info',
+                                         'get_firmware_info')
+                self._firmware_info = (info.major_version, info.minor_version)
+            except InferenceException:
+                # Request is not supported by firmware, default to 1.0
+                self._firmware_info = (1, 0)
+        return self._firmware_info
+
+    def _image_inference_request(self, model_name, image, params=None):
+        """Returns serialized image_inference request.
+
+        Returns:
+          (memoryview of the request, its buffer), the buffer must be handed
+          back with _release_buffer once the request has been sent.
+        """
+        if not model_name:
+            raise ValueError('Model name must not be empty.')
+
+        width, height = image.size
+
         request = protocol_pb2.Request()
-        request.get_firmware_info.SetInParent()
+        request.image_inference.model_name = model_name
+        request.image_inference.tensor.shape.height = height
+        request.image_inference.tensor.shape.width = width
+        request.image_inference.tensor.shape.depth = len(image.mode)
+        for key, value in (params or {}).items():
+            request.image_inference.params[key] = str(value)
+
         try:
-            info = self._communicate(request).firmware_info
-            return (info.major_version, info.minor_version)
-        except InferenceException:
-            # Request is not supported by firmware, default to 1.0
-            return (1, 0)
+            buffer = self._image_buffers.pop()
+        except IndexError:
+            buffer = None
+        try:
+            return _image_inference_request(request.image_inference, image, buffer)
+        except Exception:
+            self._release_buffer(buffer)
+            raise
+
+    def _release_buffer(self, buffer):
+        if buffer is not None:
+            self._image_buffers.append(buffer)
 
     def image_inference(self, model_name, image, params=None):
         """Runs inference on image using model (identified by model_name).
@@ -289,29 +913,164 @@ class InferenceEngine(object):
         Returns:
           protocol_pb2.Response
         """
-        if not model_name:
-            raise ValueError('Model name must not be empty.')
-
         logging.info('Image inference with model "%s"...', model_name)
 
-        width, height = image.size
+        data, buffer = self._image_inference_request(model_name, image, params)
+        try:
+            return self._inference_result(data, 'image_inference')
+        finally:
+            self._release_buffer(buffer)
+
+
+ModelManagerStats = collections.namedtuple('ModelManagerStats', [
+    'hits',       # load_model calls served by an already resident model.
+    'misses',     # load_model calls that uploaded the model.
+    'evictions',  # Models unloaded to make room for others.
+    'resident',   # Names of resident models, least recently used first.
+])
+
+
+def _is_out_of_memory(error):
+    """Returns True if InferenceException reports that memory is exhausted."""
+    return 'memory' in str(error).lower()
 
-        request = protocol_pb2.Request()
-        request.image_inference.model_name = model_name
-        request.image_inference.tensor.shape.height = height
-        request.image_inference.tensor.shape.width = width
 
-        if image.mode == 'RGB':
-            r, g, b = image.split()
-            request.image_inference.tensor.shape.depth = 3
-            request.image_inference.tensor.data = r.tobytes() + g.tobytes() + b.tobytes()
-        elif image.mode == 'L':
-            request.image_inference.tensor.shape.depth = 1
-            request.image_inference.tensor.data = image.tobytes()
+def _is_already_loaded(error):
+    """Returns True if InferenceException reports that model is loaded."""
+    return 'already loaded' in str(error).lower()
+
+
+class ModelManager(object):
+    """Keeps models resident on VisionBonnet across inference sessions.
+
+    CameraInference and ImageInference created with a manager do not unload
+    their model on close, so the next session with the same model does not
+    upload the compute graph again. Least recently used models are evicted
+    when max_models is reached or when VisionBonnet runs out of memory while
+    loading a model. Models pinned with acquire() are never evicted, so
+    max_models may be exceeded while they are in use.
+
+    Models loaded by somebody else, e.g. another engine, are used as they are
+    but never unloaded by the manager.
+    """
+
+    def __init__(self, engine=None, max_models=None):
+        """Initializes ModelManager.
+
+        Args:
+          engine: InferenceEngine to use, a new one is created if None. A passed
+            engine is not closed by close().
+          max_models: int, max number of resident models, None for no limit.
+        """
+        self._owns_engine = engine is None
+        self._engine = engine or InferenceEngine()
+        self._max_models = max_models
+        self._resident = collections.OrderedDict()  # name -> ModelDescriptor
+        self._pins = collections.Counter()  # name -> number of users
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def engine(self):
+        return self._engine
+
+    def is_resident(self, model_name):
+        with self._lock:
+            return model_name in self._resident
+
+    def load_model(self, descriptor):
+        """Makes model resident on VisionBonnet.
+
+        Args:
+          descriptor: ModelDescriptor.
+        Returns:
+          Model identifier.
+        """
+        with self._lock:
+            if descriptor.name in self._resident:
+                self._resident.move_to_end(descriptor.name)
+                self._hits += 1
+                return descriptor.name
+
+            while self._max_models and len(self._resident) >= self._max_models:
+                if not self._evict():
+                    break
+
+            self._engine._check_firmware()  # pylint: disable=protected-access
+            while True:
+                try:
+                    key = self._engine._load_model(  # pylint: disable=protected-access
+                        descriptor, ignore_errors=False)
+                    break
+                except InferenceException as e:
+                    if _is_already_loaded(e):
+                        # Loaded by somebody else, usable but not ours to unload.
+                        self._hits += 1
+                        return descriptor.name
+                    if not _is_out_of_memory(e) or not self._evict():
+                        raise
+
+            self._misses += 1
+            self._resident[key] = descriptor
+            return key
+
+    def acquire(self, descriptor):
+        """Same as load_model, but the model is pinned until release()."""
+        with self._lock:
+            key = self.load_model(descriptor)
+            self._pins[key] += 1
+            return key
+
+    def release(self, model_name):
+        """Unpins model acquired with acquire(), it stays resident."""
+        with self._lock:
+            if self._pins[model_name] > 1:
+                self._pins[model_name] -= 1
+            else:
+                self._pins.pop(model_name, None)
+            while self._max_models and len(self._resident) > self._max_models:
+                if not self._evict():
+                    break
+
+    def unload_model(self, model_name):
+        """Unloads resident model."""
+        with self._lock:
+            if self._resident.pop(model_name, None):
+                self._engine.unload_model(model_name)
+
+    def _evict(self):
+        """Unloads least recently used unpinned model, False if there is none."""
+        for model_name in self._resident:
+            if not self._pins[model_name]:
+                break
         else:
-            raise InferenceException('Unsupported image format: %s. Must be L or RGB.' % image.mode)
+            return False
+        del self._resident[model_name]
+        logging.info('Evicting model "%s"...', model_name)
+        self._engine.unload_model(model_name)
+        self._evictions += 1
+        return True
+
+    def stats(self):
+        """Returns ModelManagerStats."""
+        with self._lock:
+            return ModelManagerStats(hits=self._hits, misses=self._misses,
+                                     evictions=self._evictions,
+                                     resident=tuple(self._resident))
 
-        for key, value in (params or {}).items():
-            request.image_inference.params[key] = str(value)
+    def close(self):
+        """Unloads all resident models."""
+        with self._lock:
+            self._pins.clear()
+            while self._resident:
+                self._engine.unload_model(self._resident.popitem()[0])
+        if self._owns_engine:
+            self._engine.close()
+
+    def __enter__(self):
+        return self
 
-        return self._communicate(request).inference_result
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
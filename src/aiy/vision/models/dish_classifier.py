@@ -13,11 +13,19 @@
 # limitations under the License.
 """API for Dish Classifier."""
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from aiy.vision import telemetry
 from aiy.vision.inference import ModelDescriptor
 from aiy.vision.models import utils
 from aiy.vision.models.dish_classifier_classes import CLASSES
 
 _COMPUTE_GRAPH_NAME = 'mobilenet_v1_192res_1.0_seefood.binaryproto'
+# Class names joined once, indexed by class index.
+_LABELS = tuple('/'.join(names) for names in CLASSES)
 
 
 def model():
@@ -28,6 +36,7 @@ def model():
         compute_graph=utils.load_compute_graph(_COMPUTE_GRAPH_NAME))
 
 
+@telemetry.timed('decode.dish_classifier')
 def get_classes(result, max_num_objects=None, object_prob_threshold=0.0):
     """Converts dish classifier model output to list of detected objects.
 
@@ -51,7 +60,7 @@ def get_classes(result, max_num_objects=None, object_prob_threshold=0.0):
     assert (shape.batch, shape.height, shape.width, shape.depth) == (1, 1, 1,
                                                                      2024)
 
-    pairs = [pair for pair in enumerate(probs) if pair[1] > object_prob_threshold]
-    pairs = sorted(pairs, key=lambda pair: pair[1], reverse=True)
-    pairs = pairs[0:max_num_objects]
-    return [('/'.join(CLASSES[index]), prob) for index, prob in pairs]
+    if np is not None:
+        probs = utils.tensor_array(tensor, np.float64)
+    pairs = utils.top_k(probs, max_num_objects, object_prob_threshold)
+    return [(_LABELS[index], prob) for index, prob in pairs]
@@ -15,6 +15,12 @@
 
 from __future__ import division
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from aiy.vision import telemetry
 from aiy.vision.inference import ModelDescriptor
 from aiy.vision.models import utils
 
@@ -58,13 +64,19 @@ def model():
         compute_graph=utils.load_compute_graph(_COMPUTE_GRAPH_NAME))
 
 
+@telemetry.timed('decode.face_detection')
 def get_faces(result):
     """Retunrs list of Face objects decoded from the inference result."""
     assert len(result.tensors) == 3
     # TODO(dkovalev): check tensor shapes
-    bboxes = _reshape(result.tensors['bounding_boxes'].data, 4)
-    face_scores = result.tensors['face_scores'].data
-    joy_scores = result.tensors['joy_scores'].data
+    if np is not None:
+        bboxes = utils.tensor_array(result.tensors['bounding_boxes']).reshape(-1, 4).tolist()
+        face_scores = utils.tensor_array(result.tensors['face_scores']).ravel().tolist()
+        joy_scores = utils.tensor_array(result.tensors['joy_scores']).ravel().tolist()
+    else:
+        bboxes = _reshape(result.tensors['bounding_boxes'].data, 4)
+        face_scores = result.tensors['face_scores'].data
+        joy_scores = result.tensors['joy_scores'].data
     assert len(bboxes) == len(joy_scores)
     assert len(bboxes) == len(face_scores)
     return [
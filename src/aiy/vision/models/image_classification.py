@@ -13,6 +13,12 @@
 # limitations under the License.
 """API for Image Classification tasks."""
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from aiy.vision import telemetry
 from aiy.vision.inference import ModelDescriptor
 from aiy.vision.models import utils
 from aiy.vision.models.image_classification_classes import CLASSES
@@ -33,6 +39,8 @@ _OUTPUT_TENSOR_NAME_MAP = {
     MOBILENET: 'MobilenetV1/Predictions/Softmax',
     SQUEEZENET: 'Prediction',
 }
+# Class names joined once, indexed by class index.
+_LABELS = tuple('/'.join(names) for names in CLASSES)
 
 
 def model(model_type=MOBILENET):
@@ -44,6 +52,7 @@ def model(model_type=MOBILENET):
             _COMPUTE_GRAPH_NAME_MAP[model_type]))
 
 
+@telemetry.timed('decode.image_classification')
 def get_classes(result, max_num_objects=None, object_prob_threshold=0.0):
     """Converts image classification model output to list of detected objects.
 
@@ -69,7 +78,7 @@ def get_classes(result, max_num_objects=None, object_prob_threshold=0.0):
     assert (shape.batch, shape.height, shape.width, shape.depth) == (1, 1, 1,
                                                                      1001)
 
-    pairs = [pair for pair in enumerate(probs) if pair[1] > object_prob_threshold]
-    pairs = sorted(pairs, key=lambda pair: pair[1], reverse=True)
-    pairs = pairs[0:max_num_objects]
-    return [('/'.join(CLASSES[index]), prob) for index, prob in pairs]
+    if np is not None:
+        probs = utils.tensor_array(tensor, np.float64)
+    pairs = utils.top_k(probs, max_num_objects, object_prob_threshold)
+    return [(_LABELS[index], prob) for index, prob in pairs]
@@ -12,17 +12,51 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """API for Object Detection tasks."""
+import collections
 import math
 import sys
+import time
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from aiy.vision import telemetry
 from aiy.vision.inference import ModelDescriptor
 from aiy.vision.models import utils
-from aiy.vision.models.object_detection_anchors import ANCHORS
+from aiy.vision.models import object_detection_anchors
 
 _COMPUTE_GRAPH_NAME = 'mobilenet_ssd_256res_0.125_person_cat_dog.binaryproto'
-_NUM_ANCHORS = len(ANCHORS)
 _MACHINE_EPS = sys.float_info.epsilon
 
+# Box encoding scales used by the SSD box coder: (y, x) and (height, width).
+_CENTER_SCALE = 10.0
+_SIZE_SCALE = 5.0
+
+
+_anchor_arrays_cache = None
+
+
+def _anchor_arrays():
+    """Returns float64 arrays of anchor centers and sizes.
+
+    Arrays are derived from the memory-mapped anchor table on first use and
+    cached.
+
+    Returns:
+      A tuple of two (num_anchors, 2) arrays: (ycenter, xcenter) and
+      (height, width).
+    """
+    global _anchor_arrays_cache
+    if _anchor_arrays_cache is None:
+        anchors = np.frombuffer(object_detection_anchors.buffer(), dtype='<f4')
+        # Float64 arithmetic, like the pure-Python decoder, keeps results identical.
+        anchors = anchors.reshape(-1, 4).astype(np.float64)
+        mins, maxs = anchors[:, 0:2], anchors[:, 2:4]
+        _anchor_arrays_cache = ((maxs + mins) / 2, maxs - mins)
+    return _anchor_arrays_cache
+
 
 class Object(object):
     """Object detection result."""
@@ -71,8 +105,9 @@ def _decode_detection_result(logit_scores, box_encodings, anchors,
     Returns:
       A list of ObjectDetection.Result.
     """
-    assert len(box_encodings) == 4 * _NUM_ANCHORS
-    assert len(logit_scores) == 4 * _NUM_ANCHORS
+    num_anchors = len(anchors)
+    assert len(box_encodings) == 4 * num_anchors
+    assert len(logit_scores) == 4 * num_anchors
 
     x0, y0 = offset
     width, height = image_size
@@ -80,7 +115,7 @@ def _decode_detection_result(logit_scores, box_encodings, anchors,
 
     score_threshold = max(score_threshold, _MACHINE_EPS)
     logit_score_threshold = math.log(score_threshold / (1 - score_threshold))
-    for i in range(_NUM_ANCHORS):
+    for i in range(num_anchors):
         logits = logit_scores[4 * i: 4 * (i + 1)]
         max_logit_score = max(logits)
         max_score_index = logits.index(max_logit_score)
@@ -99,6 +134,63 @@ def _decode_detection_result(logit_scores, box_encodings, anchors,
     return objs
 
 
+def _decode_detection_result_np(logit_scores, box_encodings, score_threshold,
+                                image_size, offset):
+    """Decodes result as bounding boxes using vectorized NumPy operations.
+
+    Gives the same output as _decode_detection_result, but thresholding, box
+    decoding and clamping are done for all anchors at once. Object instances are
+    only created for candidates above the threshold.
+
+    Args:
+      logit_scores: sequence of scores
+      box_encodings: sequence of bounding boxes
+      score_threshold: float, bounding box candidates below this threshold will
+        be rejected.
+      image_size: (width, height)
+      offset: (x, y)
+    Returns:
+      A list of ObjectDetection.Result.
+    """
+    anchor_centers, anchor_sizes = _anchor_arrays()
+    num_anchors = len(anchor_centers)
+    assert len(box_encodings) == 4 * num_anchors
+    assert len(logit_scores) == 4 * num_anchors
+
+    x0, y0 = offset
+    width, height = image_size
+
+    score_threshold = max(score_threshold, _MACHINE_EPS)
+    logit_score_threshold = math.log(score_threshold / (1 - score_threshold))
+
+    logits = np.asarray(logit_scores, dtype=np.float64).reshape(num_anchors, 4)
+    kinds = logits.argmax(axis=1)
+    max_logits = logits[np.arange(num_anchors), kinds]
+    # Skip if max score is below threshold or max score is 'background'.
+    indices = np.flatnonzero((kinds != 0) & (max_logits > logit_score_threshold))
+    if not indices.size:
+        return []
+
+    encodings = np.asarray(box_encodings, dtype=np.float64).reshape(num_anchors, 4)
+    encodings = encodings[indices]
+    anchor_sizes = anchor_sizes[indices]
+    centers = anchor_centers[indices] + anchor_sizes * (encodings[:, 0:2] / _CENTER_SCALE)
+    sizes = np.exp(encodings[:, 2:4] / _SIZE_SCALE) * anchor_sizes
+
+    # Clamp values to [0.0, 1.0] range, see _decode_box_encoding.
+    mins = np.clip(centers - sizes / 2, 0.0, 1.0)
+    maxs = np.clip(centers + sizes / 2, 0.0, 1.0)
+    (ymin, xmin), (ymax, xmax) = mins.T, maxs.T
+
+    xs = (x0 + xmin * width).astype(np.int64).tolist()
+    ys = (y0 + ymin * height).astype(np.int64).tolist()
+    ws = ((xmax - xmin) * width).astype(np.int64).tolist()
+    hs = ((ymax - ymin) * height).astype(np.int64).tolist()
+    scores = (1.0 / (1.0 + np.exp(-max_logits[indices]))).tolist()
+    return [Object((x, y, w, h), kind, score) for x, y, w, h, kind, score in
+            zip(xs, ys, ws, hs, kinds[indices].tolist(), scores)]
+
+
 def _clamp(value):
     """Clamps value to range [0.0, 1.0]."""
     return min(max(0.0, value), 1.0)
@@ -183,31 +275,118 @@ def _overlap_ratio(box1, box2):
     return 1.0
 
 
-def _non_maximum_suppression(objs, overlap_threshold=0.5):
+def _overlap_ratios(box, boxes):
+    """Computes overlap ratios of one bounding box against many.
+
+    Args:
+      box: array of 4 floats, (x, y, width, height).
+      boxes: (n, 4) array of (x, y, width, height) rows.
+
+    Returns:
+      Array of n floats, same values as _overlap_ratio for each row.
+    """
+    x = np.maximum(box[0], boxes[:, 0])
+    y = np.maximum(box[1], boxes[:, 1])
+    width = np.maximum(np.minimum(box[0] + box[2], boxes[:, 0] + boxes[:, 2]) - x, 0)
+    height = np.maximum(np.minimum(box[1] + box[3], boxes[:, 1] + boxes[:, 3]) - y, 0)
+    intersection_area = width * height
+    union_area = box[2] * box[3] + boxes[:, 2] * boxes[:, 3] - intersection_area
+    ratios = np.ones_like(union_area)
+    np.divide(intersection_area, union_area, out=ratios, where=union_area > 0)
+    return ratios
+
+
+def _suppress_np(boxes, scores, overlap_threshold, max_detections,
+                 soft_nms_sigma, score_threshold):
+    """Array-based NMS over a single group of boxes.
+
+    Returns:
+      A list of (index, score) pairs of kept boxes ordered by score.
+    """
+    boxes = np.array(boxes, dtype=np.float64)
+    scores = np.array(scores, dtype=np.float64)
+    remaining = np.argsort(-scores, kind='mergesort')
+    kept = []
+    while remaining.size and len(kept) != max_detections:
+        if soft_nms_sigma is not None:
+            # Decayed scores are no longer sorted, pick the current maximum.
+            best = scores[remaining].argmax()
+            remaining[[0, best]] = remaining[[best, 0]]
+        i, remaining = remaining[0], remaining[1:]
+        kept.append((i, scores[i]))
+        ratios = _overlap_ratios(boxes[i], boxes[remaining])
+        if soft_nms_sigma is None:
+            remaining = remaining[ratios <= overlap_threshold]
+        else:
+            scores[remaining] *= np.exp(-ratios * ratios / soft_nms_sigma)
+            remaining = remaining[scores[remaining] >= score_threshold]
+    return [(int(i), float(score)) for i, score in kept]
+
+
+def _suppress_py(boxes, scores, overlap_threshold, max_detections,
+                 soft_nms_sigma, score_threshold):
+    """Pure-Python fallback for _suppress_np."""
+    scores = list(scores)
+    remaining = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+    kept = []
+    while remaining and len(kept) != max_detections:
+        if soft_nms_sigma is not None:
+            best = max(range(len(remaining)), key=lambda j: scores[remaining[j]])
+            remaining[0], remaining[best] = remaining[best], remaining[0]
+        i, remaining = remaining[0], remaining[1:]
+        kept.append((i, scores[i]))
+        if soft_nms_sigma is None:
+            remaining = [j for j in remaining
+                         if _overlap_ratio(boxes[i], boxes[j]) <= overlap_threshold]
+        else:
+            for j in remaining:
+                ratio = _overlap_ratio(boxes[i], boxes[j])
+                scores[j] *= math.exp(-ratio * ratio / soft_nms_sigma)
+            remaining = [j for j in remaining if scores[j] >= score_threshold]
+    return kept
+
+
+def _non_maximum_suppression(objs, overlap_threshold=0.5, max_detections=None,
+                             per_class=True, soft_nms_sigma=None,
+                             score_threshold=0.0):
     """Runs Non Maximum Suppression.
 
     Removes candidate that overlaps with existing candidate who has higher
-    score.
+    score. With soft-NMS, scores of overlapping candidates are decayed by
+    exp(-overlap^2 / sigma) instead, and candidates whose decayed score drops
+    below score_threshold are removed.
 
     Args:
       objs: list of ObjectDetection.Object
       overlap_threshold: float
+      max_detections: int, max number of objects to return, None for no limit.
+      per_class: bool, only objects of the same kind suppress each other.
+      soft_nms_sigma: float, enables soft-NMS with the given sigma.
+      score_threshold: float, min decayed score kept by soft-NMS.
     Returns:
-      A list of ObjectDetection.Object
+      A list of ObjectDetection.Object ordered by score from highest to lowest.
     """
-    objs = sorted(objs, key=lambda x: x.score, reverse=True)
-    for i in range(len(objs)):
-        if objs[i].score < 0.0:
-            continue
-        # Suppress any nearby bounding boxes having lower score than boxes[i]
-        for j in range(i + 1, len(objs)):
-            if objs[j].score < 0.0:
-                continue
-            if _overlap_ratio(objs[i].bounding_box,
-                              objs[j].bounding_box) > overlap_threshold:
-                objs[j].score = -1.0  # Suppress box
-
-    return [obj for obj in objs if obj.score >= 0.0]  # Exclude suppressed boxes
+    if per_class:
+        groups = {}
+        for obj in objs:
+            groups.setdefault(obj.kind, []).append(obj)
+        groups = groups.values()
+    else:
+        groups = [objs]
+
+    suppress = _suppress_np if np is not None else _suppress_py
+    result = []
+    for group in groups:
+        kept = suppress([obj.bounding_box for obj in group],
+                        [obj.score for obj in group],
+                        overlap_threshold, max_detections,
+                        soft_nms_sigma, score_threshold)
+        for i, score in kept:
+            group[i].score = score
+            result.append(group[i])
+
+    result.sort(key=lambda obj: obj.score, reverse=True)
+    return result[:max_detections]
 
 
 def model():
@@ -219,12 +398,126 @@ def model():
 
 
 # TODO: check all tensor shapes
-def get_objects(result, score_threshold=0.3, offset=(0, 0)):
+@telemetry.timed('decode.object_detection')
+def get_objects(result, score_threshold=0.3, offset=(0, 0),
+                overlap_threshold=0.5, max_detections=None, per_class=True,
+                soft_nms_sigma=None):
+    """Returns list of Object instances decoded from the inference result.
+
+    Args:
+      result: output tensors from object detection model.
+      score_threshold: float, min score of each returned object.
+      offset: (x, y), added to all bounding box coordinates.
+      overlap_threshold: float, NMS overlap ratio above which the lower scored
+        bounding box is suppressed.
+      max_detections: int, max number of objects to return, None for no limit.
+      per_class: bool, run NMS separately for each object kind.
+      soft_nms_sigma: float, use soft-NMS with the given sigma instead of
+        removing overlapping bounding boxes.
+    """
+    objs = _decode_objects(result, score_threshold, offset)
+    return _non_maximum_suppression(objs, overlap_threshold, max_detections,
+                                    per_class, soft_nms_sigma, score_threshold)
+
+
+def _decode_objects(result, score_threshold, offset):
+    """Returns Objects decoded from the inference result, before NMS."""
     assert len(result.tensors) == 2
+    size = (result.window.width, result.window.height)
+    if np is not None:
+        # Float64 keeps results identical to the pure-Python decoder.
+        logit_scores = utils.tensor_array(result.tensors['concat_1'], np.float64)
+        box_encodings = utils.tensor_array(result.tensors['concat'], np.float64)
+        return _decode_detection_result_np(logit_scores.ravel(), box_encodings.ravel(),
+                                           score_threshold, size, offset)
     logit_scores = tuple(result.tensors['concat_1'].data)
     box_encodings = tuple(result.tensors['concat'].data)
-
-    size = (result.window.width, result.window.height)
-    objs = _decode_detection_result(logit_scores, box_encodings, ANCHORS,
+    return _decode_detection_result(logit_scores, box_encodings,
+                                    object_detection_anchors.anchors(),
                                     score_threshold, size, offset)
-    return _non_maximum_suppression(objs)
+
+
+def _tile_positions(length, tile, step):
+    """Returns evenly spread tile starts covering [0, length), edges included."""
+    if length <= tile:
+        return [0]
+    count = int(math.ceil((length - tile) / step)) + 1
+    return [int(round(i * (length - tile) / (count - 1))) for i in range(count)]
+
+
+def tile_grid(image_size, tile_size=(256, 256), overlap=0.25):
+    """Returns (x, y, width, height) of overlapping tiles covering the image.
+
+    Args:
+      image_size: (width, height) of the image.
+      tile_size: (width, height) of each tile, tiles are smaller only if the
+        image is.
+      overlap: float in [0, 1), min fraction of a tile shared with its
+        neighbours.
+    """
+    width, height = image_size
+    tile_width, tile_height = min(tile_size[0], width), min(tile_size[1], height)
+    xs = _tile_positions(width, tile_width, max(tile_width * (1.0 - overlap), 1.0))
+    ys = _tile_positions(height, tile_height, max(tile_height * (1.0 - overlap), 1.0))
+    return [(x, y, tile_width, tile_height) for y in ys for x in xs]
+
+
+TilingStats = collections.namedtuple('TilingStats', [
+    'tiles',          # Number of tiles of the latest image.
+    'latency_ms',     # Time to detect objects in the latest image.
+    'ms_per_tile',    # Latency divided by tile count.
+])
+
+
+class TiledObjectDetector(object):
+    """Detects small objects by running the model on overlapping tiles.
+
+    Tiles are cropped at model resolution, sent through
+    ImageInference.run_many, and the detections of all tiles are merged with
+    a single global NMS:
+
+        with ImageInference(object_detection.model()) as inference:
+            detector = object_detection.TiledObjectDetector(inference)
+            objects = detector.get_objects(image)
+            print(detector.stats())
+    """
+
+    def __init__(self, inference, tile_size=(256, 256), overlap=0.25,
+                 workers=1, prefetch=2):
+        """Initializes TiledObjectDetector.
+
+        Args:
+          inference: ImageInference running the object detection model.
+          tile_size: (width, height) of each tile, defaults to model input.
+          overlap: float, min fraction of a tile shared with its neighbours,
+            should cover the size of the smallest objects of interest.
+          workers: int, threads cropping and packing tiles, see run_many.
+          prefetch: int, tiles prepared ahead, see run_many.
+        """
+        self._inference = inference
+        self._tile_size = tile_size
+        self._overlap = overlap
+        self._workers = workers
+        self._prefetch = prefetch
+        self._stats = TilingStats(0, 0.0, 0.0)
+
+    def get_objects(self, image, score_threshold=0.3, overlap_threshold=0.5,
+                    max_detections=None, per_class=True, soft_nms_sigma=None):
+        """Returns list of Objects in image coordinates, see get_objects."""
+        start = time.time()
+        tiles = tile_grid(image.size, self._tile_size, self._overlap)
+        crops = (image.crop((x, y, x + w, y + h)) for x, y, w, h in tiles)
+        results = self._inference.run_many(crops, workers=self._workers,
+                                           prefetch=self._prefetch)
+        objs = []
+        for (x, y, _, _), result in zip(tiles, results):
+            objs.extend(_decode_objects(result, score_threshold, (x, y)))
+        objs = _non_maximum_suppression(objs, overlap_threshold, max_detections,
+                                        per_class, soft_nms_sigma, score_threshold)
+        latency = 1000 * (time.time() - start)
+        self._stats = TilingStats(len(tiles), latency, latency / len(tiles))
+        return objs
+
+    def stats(self):
+        """Returns TilingStats of the latest get_objects call."""
+        return self._stats
@@ -1,9 +1,119 @@
 """Utility to load compute graphs from diffrent sources."""
 
+import heapq
 import os
+import threading
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-def load_compute_graph(name):
+
+# Process-wide compute graph cache: path -> ((size, mtime), graph bytes).
+_compute_graph_cache = {}
+_compute_graph_cache_lock = threading.Lock()
+
+
+def _compute_graph_path(name):
     path = os.environ.get('VISION_BONNET_MODELS_PATH', '/opt/aiy/models')
-    with open(os.path.join(path, name), 'rb') as f:
+    return os.path.join(path, name)
+
+
+def _read_compute_graph(path):
+    # The bytes are cached and shared by every load_model request, so one
+    # plain read per graph version is all the copying there is.
+    with open(path, 'rb') as f:
         return f.read()
+
+
+def load_compute_graph(name):
+    """Returns compute graph bytes, cached per process.
+
+    The cache is keyed by file path and revalidated by file size and
+    modification time on every call, so updated graphs are picked up.
+    """
+    path = _compute_graph_path(name)
+    stat = os.stat(path)
+    version = (stat.st_size, stat.st_mtime_ns)
+    with _compute_graph_cache_lock:
+        entry = _compute_graph_cache.get(path)
+    if entry and entry[0] == version:
+        return entry[1]
+
+    graph = _read_compute_graph(path)
+    with _compute_graph_cache_lock:
+        _compute_graph_cache[path] = (version, graph)
+    return graph
+
+
+def invalidate_compute_graph_cache(name=None):
+    """Drops cached compute graph, or all cached graphs if name is None."""
+    with _compute_graph_cache_lock:
+        if name is None:
+            _compute_graph_cache.clear()
+        else:
+            _compute_graph_cache.pop(_compute_graph_path(name), None)
+
+
+def tensor_shape(tensor):
+    """Returns (batch, height, width, depth) of FloatTensor."""
+    shape = tensor.shape
+    return (shape.batch, shape.height, shape.width, shape.depth)
+
+
+def tensor_array(tensor, dtype=None):
+    """Returns FloatTensor data as NumPy array shaped according to its TensorShape.
+
+    Data is copied once, straight from the protobuf container without
+    intermediate Python lists or tuples. If the shape is not set or does not
+    match the number of values, a flat array is returned.
+
+    Args:
+      tensor: protocol_pb2.FloatTensor.
+      dtype: NumPy dtype of the returned array, float32 by default.
+
+    Returns:
+      NumPy array of shape (batch, height, width, depth).
+    """
+    data = tensor.data
+    array = np.fromiter(data, dtype=dtype or np.float32, count=len(data))
+    shape = tensor_shape(tensor)
+    if array.size and shape[0] * shape[1] * shape[2] * shape[3] == array.size:
+        return array.reshape(shape)
+    return array
+
+
+def top_k(values, k=None, threshold=0.0):
+    """Selects the k highest values greater than threshold.
+
+    NumPy arrays are handled with a linear-time partial selection instead of a
+    full sort. Equal values keep index order, like a stable sort would.
+
+    Args:
+      values: NumPy array or sequence of floats.
+      k: int, max number of values to select, None for no limit.
+      threshold: float, min value (exclusive) to select.
+
+    Returns:
+      A list of (index, value) pairs ordered by value from highest to lowest.
+    """
+    if np is None or not isinstance(values, np.ndarray):
+        pairs = [pair for pair in enumerate(values) if pair[1] > threshold]
+        if k is None:
+            return sorted(pairs, key=lambda pair: pair[1], reverse=True)
+        return heapq.nlargest(k, pairs, key=lambda pair: pair[1])
+
+    values = values.ravel()
+    if k is not None and k < values.size:
+        if k <= 0:
+            return []
+        kth = values[np.argpartition(-values, k - 1)[k - 1]]
+        indices = np.flatnonzero(values > kth)
+        ties = np.flatnonzero(values == kth)[0:k - indices.size]
+        indices = np.concatenate((indices, ties))
+        indices = indices[values[indices] > threshold]
+    else:
+        indices = np.flatnonzero(values > threshold)
+    indices = indices[np.argsort(-values[indices], kind='mergesort')]
+    return list(zip(indices.tolist(), values[indices].tolist()))
@@ -0,0 +1,192 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Record and replay of camera inference streams.
+
+Recording captures what CameraInference.run() produces:
+
+    with InferenceRecorder(CameraInference(face_detection.model()),
+                           'faces.aiyrec') as inference:
+        for result in inference.run():
+            ...
+
+ReplayInference has the same interface as CameraInference and needs neither
+camera nor VisionBonnet, so decoders can be profiled on any machine:
+
+    with ReplayInference('faces.aiyrec') as inference:
+        for result in inference.run():
+            faces = face_detection.get_faces(result)
+
+File format: 8-byte header (b'AIYR', uint32 version), then one record per
+result: int64 frame timestamp (us), int64 host receive time (us), uint32 size,
+followed by size bytes of serialized InferenceResult. Integers are
+little-endian.
+"""
+
+import collections
+import struct
+import time
+
+from aiy.vision.inference import PipelineStats
+from aiy.vision.proto import protocol_pb2
+
+_MAGIC = b'AIYR'
+_VERSION = 1
+_FILE_HEADER = struct.Struct('<4sI')
+_RECORD_HEADER = struct.Struct('<qqI')
+
+
+class InferenceRecorder(object):
+    """Wraps CameraInference and writes every produced result to a file."""
+
+    def __init__(self, inference, path):
+        """Initializes InferenceRecorder.
+
+        Args:
+          inference: CameraInference to record, closed by close().
+          path: string, file to write.
+        """
+        self._inference = inference
+        self._file = open(path, 'wb')
+        self._file.write(_FILE_HEADER.pack(_MAGIC, _VERSION))
+
+    def camera_state(self):
+        return self._inference.camera_state()
+
+    def write(self, result):
+        """Appends InferenceResult to the recording."""
+        data = result.SerializeToString()
+        self._file.write(_RECORD_HEADER.pack(result.frame.timestamp_us,
+                                             int(time.time() * 1e6), len(data)))
+        self._file.write(data)
+
+    def run(self, *args, **kwargs):
+        """Same as CameraInference.run, every result is also recorded."""
+        for result in self._inference.run(*args, **kwargs):
+            self.write(result)
+            yield result
+
+    def close(self):
+        self._file.close()
+        self._inference.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+
+def read_records(path):
+    """Yields (frame_timestamp_us, host_time_us, serialized result) of a recording."""
+    with open(path, 'rb') as f:
+        magic, version = _FILE_HEADER.unpack(f.read(_FILE_HEADER.size))
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError('%s is not an inference recording.' % path)
+        while True:
+            header = f.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                return
+            timestamp_us, host_time_us, size = _RECORD_HEADER.unpack(header)
+            data = f.read(size)
+            if len(data) < size:
+                return  # Truncated recording, e.g. recorder was killed.
+            yield timestamp_us, host_time_us, data
+
+
+class ReplayInference(object):
+    """Replays a recording with the same interface as CameraInference."""
+
+    def __init__(self, path, realtime=False, loop=False):
+        """Initializes ReplayInference.
+
+        Args:
+          path: string, recording written by InferenceRecorder.
+          realtime: bool, reproduce the original pace instead of replaying as
+            fast as possible.
+          loop: bool, restart from the beginning at the end of the recording,
+            unless the recording has no results.
+        """
+        self._path = path
+        self._realtime = realtime
+        self._loop = loop
+        self._camera_state = None
+        self._times = collections.deque(maxlen=30)
+
+    def camera_state(self):
+        """Returns CameraState with the frame size of the first result."""
+        if self._camera_state is None:
+            state = protocol_pb2.CameraState(running=True)
+            for _, _, data in read_records(self._path):
+                result = protocol_pb2.InferenceResult()
+                result.ParseFromString(data)
+                state.width, state.height = result.width, result.height
+                break
+            self._camera_state = state
+        return self._camera_state
+
+    def _results(self):
+        start = first = None
+        for timestamp_us, host_time_us, data in read_records(self._path):
+            if self._realtime:
+                # Prefer camera time, fall back to host time if not recorded.
+                at = (timestamp_us or host_time_us) / 1e6
+                if start is None:
+                    start, first = time.time(), at
+                delay = start + (at - first) - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            result = protocol_pb2.InferenceResult()
+            result.ParseFromString(data)
+            yield result
+
+    def run(self, prefetch=0, policy=None, rate=None):
+        """Yields recorded InferenceResults.
+
+        Args:
+          prefetch: ignored, accepted for compatibility with CameraInference.
+          policy: ignored, accepted for compatibility with CameraInference.
+          rate: RateController to throttle replay with.
+        """
+        self._times.clear()
+        while True:
+            empty = True
+            for result in self._results():
+                empty = False
+                self._times.append(time.time())
+                start = time.time()
+                yield result
+                if rate:
+                    delay = rate.delay(result, time.time() - start)
+                    if delay:
+                        time.sleep(delay)
+                    rate.start_request()
+            if empty or not self._loop:
+                return
+
+    def stats(self):
+        """Returns PipelineStats of the current run, nothing is prefetched."""
+        times = self._times
+        fps = 0.0
+        if len(times) > 1 and times[-1] > times[0]:
+            fps = (len(times) - 1) / (times[-1] - times[0])
+        return PipelineStats(queue_depth=0, dropped_frames=0, fps=fps)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
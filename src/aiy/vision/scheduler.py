@@ -0,0 +1,180 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Runs several models on the camera stream of one VisionBonnet.
+
+VisionBonnet runs camera inference for one model at a time. CameraScheduler
+keeps all models resident and interleaves them frame by frame, switching the
+running model according to per-model target rates:
+
+    with CameraScheduler() as scheduler:
+        scheduler.add_model(face_detection.model(), target_fps=10)
+        scheduler.add_model(object_detection.model(), target_fps=2)
+        for model_name, result in scheduler.run():
+            ...
+"""
+
+import collections
+import time
+
+from aiy.vision.inference import ModelManager
+
+TaggedResult = collections.namedtuple('TaggedResult', ['model_name', 'result'])
+
+ModelStats = collections.namedtuple('ModelStats', [
+    'model_name',  # Model name.
+    'target_fps',  # Requested frame rate, None for as fast as possible.
+    'frames',      # Number of results produced.
+    'fps',         # Achieved frame rate.
+])
+
+SchedulerStats = collections.namedtuple('SchedulerStats', [
+    'switches',        # Number of model switches.
+    'mean_switch_ms',  # Mean time to stop and restart camera inference.
+    'max_switch_ms',   # Max time to stop and restart camera inference.
+    'models',          # List of ModelStats.
+])
+
+
+class _Model(object):
+
+    def __init__(self, name, target_fps, params):
+        self.name = name
+        self.target_fps = target_fps
+        self.params = params
+        self.next_due = 0.0
+        self.frames = 0
+        self.times = collections.deque(maxlen=30)
+
+    def fps(self):
+        times = self.times
+        if len(times) > 1 and times[-1] > times[0]:
+            return (len(times) - 1) / (times[-1] - times[0])
+        return 0.0
+
+
+class CameraScheduler(object):
+    """Interleaves resident models on the camera stream by frame."""
+
+    def __init__(self, manager=None):
+        """Initializes CameraScheduler.
+
+        Args:
+          manager: ModelManager to load models with, a new one is created if
+            None. A passed manager is not closed by close().
+        """
+        self._owns_manager = manager is None
+        self._manager = manager or ModelManager()
+        self._models = []
+        self._current = None
+        self._switches = 0
+        self._switch_time = 0.0
+        self._max_switch_time = 0.0
+
+    def add_model(self, descriptor, target_fps=None, params=None):
+        """Adds model to the schedule.
+
+        Args:
+          descriptor: ModelDescriptor of the model to run.
+          target_fps: float, frame rate to run the model at, None for as fast as
+            possible. Models without target rate share the remaining frames.
+          params: dict, additional parameters to start camera inference.
+        Returns:
+          Model identifier.
+        """
+        name = self._manager.acquire(descriptor)
+        self._models.append(_Model(name, target_fps, params))
+        return name
+
+    def _next_model(self):
+        # Earliest due model wins, the running one on ties to avoid switching.
+        return min(self._models,
+                   key=lambda model: (model.next_due, model is not self._current))
+
+    def _switch(self, model):
+        engine = self._manager.engine
+        start = time.time()
+        if self._current:
+            engine.stop_camera_inference()
+        self._current = None
+        engine.start_camera_inference(model.name, model.params)
+        self._current = model
+        if self._switches:
+            elapsed = time.time() - start
+            self._switch_time += elapsed
+            self._max_switch_time = max(self._max_switch_time, elapsed)
+        self._switches += 1
+
+    def run(self):
+        """Yields TaggedResult of every frame, from all scheduled models.
+
+        Results are tagged with the model that produced them.
+        """
+        if not self._models:
+            raise ValueError('No models to schedule.')
+
+        engine = self._manager.engine
+        while True:
+            model = self._next_model()
+            delay = model.next_due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            if model is not self._current:
+                self._switch(model)
+
+            result = engine.camera_inference()
+            if result.model_name != model.name:
+                # Latest result right after a switch may still come from the
+                # previous model, it does not count as a frame of this one.
+                yield TaggedResult(result.model_name, result)
+                continue
+
+            now = time.time()
+            if model.target_fps:
+                # Schedule from the first frame, not from the initial next_due.
+                last_due = model.next_due if model.frames else now
+                model.next_due = max(last_due + 1.0 / model.target_fps, now)
+            else:
+                model.next_due = now
+            model.frames += 1
+            model.times.append(now)
+            yield TaggedResult(model.name, result)
+
+    def stats(self):
+        """Returns SchedulerStats.
+
+        The initial start of camera inference is not counted as a switch.
+        """
+        switches = max(self._switches - 1, 0)
+        return SchedulerStats(
+            switches=switches,
+            mean_switch_ms=1000 * self._switch_time / switches if switches else 0.0,
+            max_switch_ms=1000 * self._max_switch_time,
+            models=[ModelStats(model.name, model.target_fps, model.frames, model.fps())
+                    for model in self._models])
+
+    def close(self):
+        if self._current:
+            self._manager.engine.stop_camera_inference()
+            self._current = None
+        for model in self._models:
+            self._manager.release(model.name)
+        self._models = []
+        if self._owns_manager:
+            self._manager.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
@@ -0,0 +1,139 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Opt-in per-frame inference telemetry.
+
+When enabled, InferenceEngine and the bundled model decoders record timings
+into rolling histograms:
+
+    transport.<request>  Transport round trip of each request type.
+    parse.<request>      Protobuf parsing of each response type.
+    bonnet.<model>       Inference time reported by VisionBonnet (duration_ms).
+    decode.<model>       Host-side decoding of inference results.
+
+Usage:
+
+    telemetry.enable()
+    ...
+    print(telemetry.snapshot()['transport.camera_inference']['p95'])
+    telemetry.dump_json('/tmp/telemetry.json')
+"""
+
+import collections
+import functools
+import json
+import threading
+import time
+
+_DEFAULT_WINDOW = 1000
+
+_enabled = False
+_window = _DEFAULT_WINDOW
+_histograms = {}
+_lock = threading.Lock()
+
+
+class Histogram(object):
+    """Rolling window of the latest values."""
+
+    def __init__(self, window):
+        self._values = collections.deque(maxlen=window)
+        self.count = 0
+
+    def add(self, value):
+        self._values.append(value)
+        self.count += 1
+
+    def summary(self):
+        """Returns dict with count and mean/p50/p95/p99/max of the window."""
+        values = sorted(self._values)
+        if not values:
+            return {'count': self.count}
+
+        def percentile(p):
+            return values[min(int(p / 100.0 * len(values)), len(values) - 1)]
+
+        return {
+            'count': self.count,
+            'mean': sum(values) / len(values),
+            'p50': percentile(50),
+            'p95': percentile(95),
+            'p99': percentile(99),
+            'max': values[-1],
+        }
+
+
+def enable(window=_DEFAULT_WINDOW):
+    """Starts recording, keeping the latest `window` values per histogram."""
+    global _enabled, _window
+    with _lock:
+        _window = window
+        _enabled = True
+
+
+def disable():
+    """Stops recording, already recorded values are kept."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """Drops all recorded values."""
+    with _lock:
+        _histograms.clear()
+
+
+def record(name, seconds):
+    """Records duration in seconds into histogram `name`."""
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram(_window)
+        histogram.add(1000.0 * seconds)
+
+
+def timed(name):
+    """Decorator recording duration of each call into histogram `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.time() - start)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """Returns {histogram name: summary dict}, durations in milliseconds."""
+    with _lock:
+        return {name: histogram.summary() for name, histogram in _histograms.items()}
+
+
+def dump_json(path=None):
+    """Returns snapshot as JSON string, also written to path if given."""
+    data = json.dumps(snapshot(), indent=2, sort_keys=True)
+    if path:
+        with open(path, 'w') as f:
+            f.write(data)
+    return data
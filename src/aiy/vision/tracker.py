@@ -0,0 +1,240 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Multi-object tracker for per-frame detections.
+
+Matches detections of consecutive frames by bounding box overlap (IoU) and
+gives each object a stable track id, age and velocity:
+
+    tracker = Tracker()
+    with CameraInference(face_detection.model()) as inference:
+        for result, tracks in tracker.track(inference.run(),
+                                            face_detection.get_faces):
+            for track in tracks:
+                print(track.id, track.bounding_box, track.velocity)
+
+Any detection with a bounding_box (x, y, width, height) attribute can be
+tracked, e.g. face_detection.Face and object_detection.Object. Detections
+with a `kind` attribute are only matched with tracks of the same kind.
+Between detections, e.g. when detection runs at a lower rate, predict()
+extrapolates track positions from their velocities.
+"""
+
+import itertools
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _iou_matrix(boxes1, boxes2):
+    """Returns IoU of every pair of (x, y, width, height) boxes, as rows x cols."""
+    if np is not None:
+        a = np.asarray(boxes1, dtype=np.float64).reshape(-1, 1, 4)
+        b = np.asarray(boxes2, dtype=np.float64).reshape(1, -1, 4)
+        width = (np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2]) -
+                 np.maximum(a[..., 0], b[..., 0]))
+        height = (np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3]) -
+                  np.maximum(a[..., 1], b[..., 1]))
+        intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+        union = a[..., 2] * a[..., 3] + b[..., 2] * b[..., 3] - intersection
+        return np.where(union > 0, intersection / np.where(union > 0, union, 1), 0.0)
+
+    def iou(box1, box2):
+        width = min(box1[0] + box1[2], box2[0] + box2[2]) - max(box1[0], box2[0])
+        height = min(box1[1] + box1[3], box2[1] + box2[3]) - max(box1[1], box2[1])
+        intersection = max(width, 0) * max(height, 0)
+        union = box1[2] * box1[3] + box2[2] * box2[3] - intersection
+        return intersection / union if union > 0 else 0.0
+
+    return [[iou(box1, box2) for box2 in boxes2] for box1 in boxes1]
+
+
+def _greedy_match(ious, threshold):
+    """Returns (row, col) pairs, highest IoU first, each row and col used once."""
+    if np is not None:
+        rows, cols = np.nonzero(ious >= threshold)
+        order = np.argsort(-ious[rows, cols], kind='mergesort')
+        candidates = zip(rows[order].tolist(), cols[order].tolist())
+    else:
+        candidates = sorted(((row, col) for row, values in enumerate(ious)
+                             for col, value in enumerate(values) if value >= threshold),
+                            key=lambda pair: -ious[pair[0]][pair[1]])
+    matches = []
+    used_rows, used_cols = set(), set()
+    for row, col in candidates:
+        if row not in used_rows and col not in used_cols:
+            used_rows.add(row)
+            used_cols.add(col)
+            matches.append((row, col))
+    return matches
+
+
+class Track(object):
+    """Tracked object.
+
+    Attributes:
+      id: int, unique track id.
+      kind: kind of the tracked detections, None if they have none.
+      detection: latest matched detection.
+      bounding_box: (x, y, width, height) of the latest matched detection.
+      velocity: (vx, vy) smoothed bounding box center velocity, pixels per
+        second.
+      age: int, number of frames since the track was created.
+      hits: int, number of frames the track was matched in.
+      misses: int, number of consecutive frames without a match.
+      timestamp: float, time of the latest match, seconds.
+    """
+
+    def __init__(self, track_id, detection, timestamp):
+        self.id = track_id
+        self.kind = getattr(detection, 'kind', None)
+        self.detection = detection
+        self.bounding_box = tuple(detection.bounding_box)
+        self.velocity = (0.0, 0.0)
+        self.age = 1
+        self.hits = 1
+        self.misses = 0
+        self.timestamp = timestamp
+
+    def predict(self, timestamp):
+        """Returns bounding box extrapolated to timestamp."""
+        dt = timestamp - self.timestamp
+        x, y, width, height = self.bounding_box
+        return (x + self.velocity[0] * dt, y + self.velocity[1] * dt, width, height)
+
+    def _update(self, detection, timestamp, smoothing):
+        x, y, width, height = detection.bounding_box
+        old_x, old_y, old_width, old_height = self.bounding_box
+        dt = timestamp - self.timestamp
+        if dt > 0:
+            vx = ((x + width / 2) - (old_x + old_width / 2)) / dt
+            vy = ((y + height / 2) - (old_y + old_height / 2)) / dt
+            if self.hits == 1:
+                self.velocity = (vx, vy)
+            else:
+                self.velocity = (self.velocity[0] + smoothing * (vx - self.velocity[0]),
+                                 self.velocity[1] + smoothing * (vy - self.velocity[1]))
+        self.detection = detection
+        self.bounding_box = (x, y, width, height)
+        self.timestamp = timestamp
+        self.hits += 1
+        self.misses = 0
+
+    def __str__(self):
+        return 'id=%d, kind=%s, bbox=%s, velocity=(%.1f, %.1f), age=%d' % (
+            self.id, self.kind, self.bounding_box, self.velocity[0],
+            self.velocity[1], self.age)
+
+
+class Tracker(object):
+    """Assigns stable ids to detections of consecutive frames."""
+
+    def __init__(self, iou_threshold=0.3, max_misses=5, min_hits=1, smoothing=0.5):
+        """Initializes Tracker.
+
+        Args:
+          iou_threshold: float, min overlap of a detection and the predicted
+            track box to match them.
+          max_misses: int, number of consecutive frames without a match after
+            which a track is dropped.
+          min_hits: int, number of matched frames before a track is reported.
+          smoothing: float in (0, 1], weight of the newest velocity measurement.
+        """
+        self._iou_threshold = iou_threshold
+        self._max_misses = max_misses
+        self._min_hits = min_hits
+        self._smoothing = smoothing
+        self._tracks = []
+        self._ids = itertools.count(1)
+
+    def _matches(self, detections, timestamp):
+        if not self._tracks or not detections:
+            return []
+        ious = _iou_matrix([track.predict(timestamp) for track in self._tracks],
+                           [detection.bounding_box for detection in detections])
+        kinds = [getattr(detection, 'kind', None) for detection in detections]
+        if any(kind is not None for kind in kinds):
+            if np is not None:
+                same = (np.array([track.kind for track in self._tracks], dtype=object)
+                        .reshape(-1, 1) == np.array(kinds, dtype=object).reshape(1, -1))
+                ious = np.where(same, ious, 0.0)
+            else:
+                ious = [[value if track.kind == kind else 0.0
+                         for value, kind in zip(values, kinds)]
+                        for track, values in zip(self._tracks, ious)]
+        return _greedy_match(ious, self._iou_threshold)
+
+    def update(self, detections, timestamp=None):
+        """Matches detections of a new frame to tracks.
+
+        Args:
+          detections: list of detections with bounding_box attribute.
+          timestamp: float, frame time in seconds, current time if None.
+
+        Returns:
+          List of tracks matched in this frame.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+
+        matched_tracks = set()
+        matched_detections = set()
+        for row, col in self._matches(detections, timestamp):
+            self._tracks[row]._update(detections[col], timestamp, self._smoothing)
+            matched_tracks.add(row)
+            matched_detections.add(col)
+
+        tracks = []
+        for i, track in enumerate(self._tracks):
+            track.age += 1
+            if i not in matched_tracks:
+                track.misses += 1
+            if track.misses <= self._max_misses:
+                tracks.append(track)
+        for i, detection in enumerate(detections):
+            if i not in matched_detections:
+                tracks.append(Track(next(self._ids), detection, timestamp))
+        self._tracks = tracks
+        return [track for track in tracks
+                if track.misses == 0 and track.hits >= self._min_hits]
+
+    def tracks(self):
+        """Returns all live tracks, including ones missed in recent frames."""
+        return list(self._tracks)
+
+    def predict(self, timestamp=None):
+        """Returns {track id: bounding box extrapolated to timestamp}."""
+        if timestamp is None:
+            timestamp = time.time()
+        return {track.id: track.predict(timestamp) for track in self._tracks
+                if track.hits >= self._min_hits}
+
+    def track(self, results, decode):
+        """Yields (result, tracks) for every inference result.
+
+        Args:
+          results: iterable of InferenceResults, e.g. CameraInference.run().
+          decode: function returning detections of a result, e.g.
+            face_detection.get_faces.
+        """
+        for result in results:
+            timestamp_us = result.frame.timestamp_us
+            timestamp = timestamp_us / 1e6 if timestamp_us else None
+            yield result, self.update(decode(result), timestamp)
+
+    def reset(self):
+        """Drops all tracks, ids keep increasing."""
+        self._tracks = []
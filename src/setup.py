@@ -6,6 +6,9 @@ setup(
     author='Peter Malkin',
     author_email='petermalkin@google.com',
     packages=find_packages(),
+    package_data={
+        'aiy.vision.models': ['object_detection_anchors.bin'],
+    },
     url="https://aiyprojects.withgoogle.com/",
     license='LICENSE.txt',
     description="AIY Python API",
@@ -0,0 +1,70 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for EngineBroker camera stream fan-out."""
+
+import threading
+import time
+import unittest
+
+from aiy.vision.broker import EngineBroker
+from aiy.vision.inference import ModelDescriptor
+from aiy.vision.proto import protocol_pb2
+
+
+class _FakeEngine(object):
+    """Engine producing a camera result every 10 ms."""
+
+    def _check_firmware(self):
+        pass
+
+    def _load_model(self, descriptor, ignore_errors=True):
+        return descriptor.name
+
+    def unload_model(self, model_name):
+        pass
+
+    def start_camera_inference(self, model_name, params=None):
+        pass
+
+    def camera_inference(self):
+        time.sleep(0.01)
+        return protocol_pb2.InferenceResult(model_name='model')
+
+    def stop_camera_inference(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class EngineBrokerTest(unittest.TestCase):
+
+    def test_close_ends_blocked_subscriptions(self):
+        broker = EngineBroker(_FakeEngine())
+        subscription = broker.subscribe(ModelDescriptor('model', (1, 0, 0, 3), (0, 1), b''))
+        results = []
+        consumer = threading.Thread(target=lambda: results.extend(subscription.run()))
+        consumer.daemon = True
+        consumer.start()
+        time.sleep(0.05)
+
+        broker.close()
+        consumer.join(2)
+        self.assertFalse(consumer.is_alive())
+        self.assertTrue(results)
+        self.assertIsNone(subscription.get(timeout=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for request serialization of the InferenceEngine API."""
+
+import random
+import unittest
+
+from PIL import Image
+
+from aiy.vision import inference
+from aiy.vision.proto import protocol_pb2
+
+
+def _random_image(rand, mode, size):
+    data = bytes(rand.getrandbits(8) for _ in range(size[0] * size[1] * len(mode)))
+    return Image.frombytes(mode, size, data)
+
+
+def _image_inference(image, params):
+    request = protocol_pb2.Request()
+    request.image_inference.model_name = 'model'
+    shape = request.image_inference.tensor.shape
+    shape.width, shape.height = image.size
+    shape.depth = len(image.mode)
+    for key, value in params.items():
+        request.image_inference.params[key] = str(value)
+    return request
+
+
+def _expected_image_inference(image, params):
+    request = _image_inference(image, params)
+    if image.mode == 'RGB':
+        r, g, b = image.split()
+        request.image_inference.tensor.data = r.tobytes() + g.tobytes() + b.tobytes()
+    else:
+        request.image_inference.tensor.data = image.tobytes()
+    return request.SerializeToString()
+
+
+class LoadModelRequestTest(unittest.TestCase):
+
+    def test_same_as_serialized_request(self):
+        request = protocol_pb2.Request()
+        request.load_model.model_name = 'model'
+        request.load_model.input_shape.batch = 1
+        request.load_model.input_shape.height = 256
+        request.load_model.input_shape.width = 256
+        request.load_model.input_shape.depth = 3
+        request.load_model.input_normalizer.mean = 128.0
+        request.load_model.input_normalizer.stddev = 128.0
+        compute_graph = bytes(range(256)) * 1000
+
+        actual = inference._load_model_request(request.load_model, compute_graph)
+        request.load_model.compute_graph = compute_graph
+        self.assertEqual(request.SerializeToString(), actual)
+
+
+class ImageInferenceRequestTest(unittest.TestCase):
+
+    def _check(self):
+        rand = random.Random(0)
+        buffer = None
+        for mode, size, params in [('RGB', (7, 5), {}),
+                                   ('L', (33, 20), {'a': 1}),
+                                   ('RGB', (300, 200), {'a': 1, 'b': 'x'}),
+                                   ('RGB', (3, 2), {'threshold': 0.5})]:
+            image = _random_image(rand, mode, size)
+            request = _image_inference(image, params)
+            data, buffer = inference._image_inference_request(
+                request.image_inference, image, buffer)
+            self.assertEqual(_expected_image_inference(image, params), bytes(data))
+
+    @unittest.skipIf(inference.np is None, 'NumPy is not installed.')
+    def test_same_as_serialized_request_numpy(self):
+        self._check()
+
+    def test_same_as_serialized_request_python(self):
+        np, inference.np = inference.np, None
+        try:
+            self._check()
+        finally:
+            inference.np = np
+
+
+if __name__ == '__main__':
+    unittest.main()
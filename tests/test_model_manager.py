@@ -0,0 +1,129 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for ModelManager residency and eviction."""
+
+import unittest
+
+from aiy.vision.inference import ImageInference
+from aiy.vision.inference import InferenceException
+from aiy.vision.inference import ModelDescriptor
+from aiy.vision.inference import ModelManager
+
+
+def _descriptor(name):
+    return ModelDescriptor(name=name, input_shape=(1, 0, 0, 3),
+                           input_normalizer=(0, 1), compute_graph=b'graph')
+
+
+class _FakeEngine(object):
+    """Engine with a model capacity, errors worded like VisionBonnet."""
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity
+        self.loaded = []
+
+    def _check_firmware(self):
+        pass
+
+    def _load_model(self, descriptor, ignore_errors=True):
+        if descriptor.name in self.loaded:
+            raise InferenceException('Model "%s" is already loaded.' % descriptor.name)
+        if self.capacity is not None and len(self.loaded) >= self.capacity:
+            raise InferenceException('Out of memory.')
+        self.loaded.append(descriptor.name)
+        return descriptor.name
+
+    def unload_model(self, model_name):
+        if model_name not in self.loaded:
+            raise InferenceException('Model "%s" is not loaded.' % model_name)
+        self.loaded.remove(model_name)
+
+    def image_inference(self, model_name, image, params=None):
+        if model_name not in self.loaded:
+            raise InferenceException('Model "%s" is not loaded.' % model_name)
+        return model_name
+
+    def close(self):
+        pass
+
+
+class ModelManagerTest(unittest.TestCase):
+
+    def test_evicts_least_recently_used_on_out_of_memory(self):
+        engine = _FakeEngine(capacity=2)
+        manager = ModelManager(engine)
+        manager.load_model(_descriptor('A'))
+        manager.load_model(_descriptor('B'))
+        manager.load_model(_descriptor('A'))
+        manager.load_model(_descriptor('C'))
+        stats = manager.stats()
+        self.assertEqual(('A', 'C'), stats.resident)
+        self.assertEqual(1, stats.evictions)
+        self.assertEqual(['A', 'C'], sorted(engine.loaded))
+
+    def test_model_loaded_elsewhere_is_a_hit_and_not_owned(self):
+        engine = _FakeEngine()
+        manager = ModelManager(engine)
+        manager.load_model(_descriptor('A'))
+        manager.load_model(_descriptor('C'))
+        engine.loaded.append('B')  # Loaded by another engine.
+
+        self.assertEqual('B', manager.load_model(_descriptor('B')))
+        stats = manager.stats()
+        self.assertEqual(0, stats.evictions)
+        self.assertEqual(1, stats.hits)
+        self.assertEqual(('A', 'C'), stats.resident)
+
+        manager.close()
+        self.assertEqual(['B'], engine.loaded)
+
+    def test_other_errors_are_raised(self):
+        def load_model(descriptor, ignore_errors=True):
+            raise InferenceException('Invalid compute graph.')
+
+        engine = _FakeEngine()
+        engine._load_model = load_model
+        manager = ModelManager(engine)
+        with self.assertRaises(InferenceException):
+            manager.load_model(_descriptor('A'))
+        self.assertEqual((), manager.stats().resident)
+
+    def test_pinned_models_are_not_evicted(self):
+        engine = _FakeEngine()
+        manager = ModelManager(engine, max_models=1)
+        first = ImageInference(_descriptor('X'), manager=manager)
+        second = ImageInference(_descriptor('Y'), manager=manager)
+        self.assertEqual('X', first.run(None))
+        self.assertEqual('Y', second.run(None))
+        self.assertEqual(('X', 'Y'), manager.stats().resident)
+
+        first.close()
+        self.assertEqual(('Y',), manager.stats().resident)
+        self.assertEqual(['Y'], engine.loaded)
+        second.close()
+        self.assertEqual(('Y',), manager.stats().resident)
+
+    def test_out_of_memory_with_all_models_pinned_is_raised(self):
+        engine = _FakeEngine(capacity=1)
+        manager = ModelManager(engine)
+        manager.acquire(_descriptor('A'))
+        with self.assertRaises(InferenceException):
+            manager.load_model(_descriptor('B'))
+        manager.release('A')
+        manager.load_model(_descriptor('B'))
+        self.assertEqual(('B',), manager.stats().resident)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the object detection decoders."""
+
+import random
+import unittest
+from unittest import mock
+
+from aiy.vision.models import object_detection
+from aiy.vision.models import object_detection_anchors
+
+
+def _random_frame(rand):
+    num_anchors = object_detection_anchors.num_anchors()
+    logits = []
+    for _ in range(num_anchors):
+        row = [rand.gauss(0.0, 2.0) for _ in range(4)]
+        if rand.random() < 0.05:
+            row[rand.randint(1, 3)] += 6.0
+        logits.extend(row)
+    encodings = [rand.gauss(0.0, 1.0) for _ in range(4 * num_anchors)]
+    return logits, encodings
+
+
+def _boxes(objs):
+    return [(obj.bounding_box, obj.kind, round(obj.score, 12)) for obj in objs]
+
+
+def _random_objects(rand, count=60):
+    # Boxes clustered around a few centers, so that many of them overlap.
+    centers = [(rand.randint(0, 400), rand.randint(0, 400)) for _ in range(5)]
+    objs = []
+    for _ in range(count):
+        x, y = rand.choice(centers)
+        box = (x + rand.randint(-20, 20), y + rand.randint(-20, 20),
+               rand.randint(20, 80), rand.randint(20, 80))
+        objs.append(object_detection.Object(box, rand.randint(1, 3), rand.random()))
+    return objs
+
+
+def _copy(objs):
+    return [object_detection.Object(obj.bounding_box, obj.kind, obj.score) for obj in objs]
+
+
+def _baseline_nms(objs, overlap_threshold):
+    # Original class-agnostic implementation.
+    objs = sorted(_copy(objs), key=lambda x: x.score, reverse=True)
+    for i in range(len(objs)):
+        if objs[i].score < 0.0:
+            continue
+        for j in range(i + 1, len(objs)):
+            if objs[j].score < 0.0:
+                continue
+            if object_detection._overlap_ratio(objs[i].bounding_box,
+                                               objs[j].bounding_box) > overlap_threshold:
+                objs[j].score = -1.0
+    return [obj for obj in objs if obj.score >= 0.0]
+
+
+@unittest.skipIf(object_detection.np is None, 'NumPy is not installed.')
+class DecodeDetectionResultTest(unittest.TestCase):
+
+    def test_numpy_decoder_matches_python_decoder(self):
+        rand = random.Random(0)
+        anchors = object_detection_anchors.anchors()
+        for _ in range(200):
+            logits, encodings = _random_frame(rand)
+            size = (rand.randint(100, 2000), rand.randint(100, 2000))
+            offset = (rand.randint(0, 100), rand.randint(0, 100))
+            expected = object_detection._decode_detection_result(
+                logits, encodings, anchors, 0.3, size, offset)
+            actual = object_detection._decode_detection_result_np(
+                logits, encodings, 0.3, size, offset)
+            self.assertEqual(_boxes(expected), _boxes(actual))
+
+
+@unittest.skipIf(object_detection.np is None, 'NumPy is not installed.')
+class NonMaximumSuppressionTest(unittest.TestCase):
+
+    def _check_parity(self, **kwargs):
+        rand = random.Random(1)
+        for _ in range(50):
+            objs = _random_objects(rand)
+            expected = object_detection._non_maximum_suppression(_copy(objs), **kwargs)
+            with mock.patch.object(object_detection, 'np', None):
+                actual = object_detection._non_maximum_suppression(_copy(objs), **kwargs)
+            self.assertEqual(_boxes(expected), _boxes(actual))
+            scores = [obj.score for obj in expected]
+            self.assertEqual(sorted(scores, reverse=True), scores)
+
+    def test_hard_nms_parity(self):
+        self._check_parity(overlap_threshold=0.3)
+
+    def test_class_agnostic_parity(self):
+        self._check_parity(overlap_threshold=0.3, per_class=False)
+
+    def test_max_detections_parity(self):
+        self._check_parity(overlap_threshold=0.3, max_detections=4)
+        self._check_parity(overlap_threshold=0.3, max_detections=4, per_class=False)
+
+    def test_soft_nms_parity(self):
+        self._check_parity(soft_nms_sigma=0.5, score_threshold=0.05)
+        self._check_parity(soft_nms_sigma=0.5, score_threshold=0.05, max_detections=10)
+
+    def test_max_detections_limits_result(self):
+        rand = random.Random(2)
+        objs = _random_objects(rand)
+        everything = object_detection._non_maximum_suppression(_copy(objs), 0.3)
+        limited = object_detection._non_maximum_suppression(_copy(objs), 0.3,
+                                                            max_detections=3)
+        self.assertEqual(_boxes(everything[:3]), _boxes(limited))
+
+    def test_soft_nms_decays_overlapping_scores(self):
+        objs = [object_detection.Object((0, 0, 100, 100), 1, 0.9),
+                object_detection.Object((10, 0, 100, 100), 1, 0.8)]
+        kept = object_detection._non_maximum_suppression(objs, soft_nms_sigma=0.5)
+        self.assertEqual(2, len(kept))
+        self.assertEqual(0.9, kept[0].score)
+        self.assertLess(kept[1].score, 0.8)
+
+    def test_matches_baseline(self):
+        rand = random.Random(3)
+        for _ in range(50):
+            objs = _random_objects(rand)
+            expected = _baseline_nms(objs, 0.3)
+            for np_module in (object_detection.np, None):
+                with mock.patch.object(object_detection, 'np', np_module):
+                    actual = object_detection._non_maximum_suppression(
+                        _copy(objs), 0.3, per_class=False)
+                self.assertEqual(_boxes(expected), _boxes(actual))
+
+
+class TileGridTest(unittest.TestCase):
+
+    def test_image_smaller_than_tile(self):
+        self.assertEqual([0], object_detection._tile_positions(200, 256, 192))
+        self.assertEqual([(0, 0, 200, 100)], object_detection.tile_grid((200, 100)))
+        self.assertEqual([(0, 0, 200, 256), (0, 44, 200, 256)],
+                         object_detection.tile_grid((200, 300)))
+
+    def test_exact_fit(self):
+        self.assertEqual([0], object_detection._tile_positions(256, 256, 192))
+        self.assertEqual([0, 256], object_detection._tile_positions(512, 256, 256))
+        self.assertEqual([(0, 0, 256, 256)], object_detection.tile_grid((256, 256)))
+        self.assertEqual([(0, 0, 256, 256), (256, 0, 256, 256)],
+                         object_detection.tile_grid((512, 256), overlap=0.0))
+
+    def test_edge_tiles_are_flush_with_border(self):
+        for size in [(1640, 1232), (640, 480), (300, 257), (1000, 1000)]:
+            for overlap in (0.0, 0.25, 0.5):
+                tiles = object_detection.tile_grid(size, overlap=overlap)
+                xs = sorted({x for x, _, _, _ in tiles})
+                ys = sorted({y for _, y, _, _ in tiles})
+                self.assertEqual(0, xs[0])
+                self.assertEqual(0, ys[0])
+                self.assertEqual(size[0], xs[-1] + 256)
+                self.assertEqual(size[1], ys[-1] + 256)
+                self.assertEqual(len(xs) * len(ys), len(tiles))
+                # Neighbours share at least the requested overlap.
+                for positions in (xs, ys):
+                    for a, b in zip(positions, positions[1:]):
+                        self.assertLessEqual(b - a, 256 * (1.0 - overlap) + 0.5)
+
+    def test_camera_frame(self):
+        tiles = object_detection.tile_grid((1640, 1232))
+        self.assertEqual(63, len(tiles))
+        self.assertEqual(35, len(object_detection.tile_grid((1640, 1232), overlap=0.0)))
+        self.assertEqual([0, 173, 346], [x for x, _, _, _ in tiles[:3]])
+
+
+if __name__ == '__main__':
+    unittest.main()
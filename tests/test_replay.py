@@ -0,0 +1,112 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for recording and replaying inference streams."""
+
+import itertools
+import os
+import shutil
+import tempfile
+import unittest
+
+from aiy.vision import replay
+from aiy.vision.proto import protocol_pb2
+
+
+def _result(index):
+    result = protocol_pb2.InferenceResult(model_name='test', width=320, height=240)
+    result.frame.index = index
+    result.frame.timestamp_us = 1000000 + 33333 * index
+    result.tensors['output'].data.extend([0.5 * index, 1.0])
+    return result
+
+
+class _FakeCameraInference(object):
+
+    def __init__(self, results):
+        self._results = results
+        self.closed = False
+
+    def camera_state(self):
+        return protocol_pb2.CameraState(running=True, width=320, height=240)
+
+    def run(self):
+        return iter(self._results)
+
+    def close(self):
+        self.closed = True
+
+
+class ReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'test.aiyrec')
+        self.results = [_result(i) for i in range(5)]
+
+    def _record(self):
+        inference = _FakeCameraInference(self.results)
+        with replay.InferenceRecorder(inference, self.path) as recorder:
+            self.assertEqual(self.results, list(recorder.run()))
+        self.assertTrue(inference.closed)
+
+    def test_read_records(self):
+        self._record()
+        records = list(replay.read_records(self.path))
+        self.assertEqual(len(self.results), len(records))
+        for result, (timestamp_us, host_time_us, data) in zip(self.results, records):
+            self.assertEqual(result.frame.timestamp_us, timestamp_us)
+            self.assertGreater(host_time_us, 0)
+            self.assertEqual(result.SerializeToString(), data)
+
+    def test_truncated_recording(self):
+        self._record()
+        size = os.path.getsize(self.path)
+        last = len(self.results[-1].SerializeToString())
+        # Cut into the data, then into the header, of the last record.
+        for cut in (1, last + 1):
+            with open(self.path, 'r+b') as f:
+                f.truncate(size - cut)
+            self.assertEqual(len(self.results) - 1,
+                             len(list(replay.read_records(self.path))))
+
+    def test_not_a_recording(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'JUNKJUNK')
+        with self.assertRaises(ValueError):
+            list(replay.read_records(self.path))
+
+    def test_replay(self):
+        self._record()
+        with replay.ReplayInference(self.path) as inference:
+            state = inference.camera_state()
+            self.assertEqual((320, 240), (state.width, state.height))
+            self.assertEqual(self.results, list(inference.run()))
+            self.assertEqual(0, inference.stats().dropped_frames)
+
+    def test_replay_loop(self):
+        self._record()
+        with replay.ReplayInference(self.path, loop=True) as inference:
+            results = list(itertools.islice(inference.run(), 12))
+        self.assertEqual((self.results * 3)[:12], results)
+
+    def test_empty_recording_does_not_loop(self):
+        self.results = []
+        self._record()
+        with replay.ReplayInference(self.path, loop=True) as inference:
+            self.assertEqual([], list(inference.run()))
+
+
+if __name__ == '__main__':
+    unittest.main()
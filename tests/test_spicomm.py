@@ -0,0 +1,121 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the growing Spicomm transaction buffer."""
+
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from aiy._drivers import _spicomm
+from aiy._drivers import _transport
+
+
+class _FakeDriver(object):
+    """Stands in for the kernel driver's transact ioctl."""
+
+    def __init__(self):
+        self.response = b''
+        self.calls = 0
+
+    def ioctl(self, dev, request, buf):
+        self.calls += 1
+        _, timeout, size, _ = _spicomm._HEADER.unpack_from(buf)
+        response = self.response
+        if len(response) > size - _spicomm.HEADER_SIZE:
+            _spicomm._HEADER.pack_into(buf, 0, _spicomm.FLAG_ERROR | _spicomm.FLAG_OVERFLOW,
+                                       timeout, size, len(response))
+            raise OSError('overflow')
+        buf[_spicomm.HEADER_SIZE:_spicomm.HEADER_SIZE + len(response)] = response
+        _spicomm._HEADER.pack_into(buf, 0, 0, timeout, size, len(response))
+
+
+class SpicommTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        self.driver = _FakeDriver()
+        for target, value in [('SPICOMM_DEV', path),
+                              ('fcntl.ioctl', self.driver.ioctl)]:
+            patcher = mock.patch('aiy._drivers._spicomm.' + target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_small_transaction_keeps_initial_buffer(self):
+        with _spicomm.Spicomm(payload_size=1024, max_payload_size=8192) as spicomm:
+            self.driver.response = b'x' * 100
+            self.assertEqual(b'x' * 100, spicomm.transact(b'request'))
+            stats = spicomm.memory_stats()
+            self.assertEqual(_spicomm.HEADER_SIZE + 1024, stats.buffer_size)
+            self.assertEqual(0, stats.grow_count)
+
+    def test_large_response_grows_buffer_and_retries(self):
+        with _spicomm.Spicomm(payload_size=1024, max_payload_size=8192) as spicomm:
+            self.driver.response = bytes(range(256)) * 12  # 3072 bytes.
+            self.assertEqual(self.driver.response, bytes(spicomm.transact_view(b'request')))
+            self.assertEqual(2, self.driver.calls)
+            stats = spicomm.memory_stats()
+            self.assertEqual(_spicomm.HEADER_SIZE + 3072, stats.buffer_size)
+            self.assertEqual(stats.buffer_size, stats.peak_buffer_size)
+            self.assertEqual(1, stats.grow_count)
+
+    def test_large_request_grows_buffer_up_front(self):
+        with _spicomm.Spicomm(payload_size=1024, max_payload_size=8192) as spicomm:
+            spicomm.transact(b'r' * 1500)
+            self.assertEqual(1, self.driver.calls)
+            self.assertEqual(_spicomm.HEADER_SIZE + 2048, spicomm.memory_stats().buffer_size)
+
+    def test_response_above_max_payload_raises(self):
+        with _spicomm.Spicomm(payload_size=1024, max_payload_size=2048) as spicomm:
+            self.driver.response = b'x' * 4096
+            with self.assertRaises(_spicomm.SpicommOverflowError):
+                spicomm.transact(b'request')
+            with self.assertRaises(_spicomm.SpicommOverflowError):
+                spicomm.transact(b'r' * 4096)
+
+    def test_shrinks_after_idle(self):
+        with _spicomm.Spicomm(payload_size=1024, max_payload_size=8192,
+                              shrink_after=0.01) as spicomm:
+            self.driver.response = b'x' * 3000
+            spicomm.transact(b'request')
+            self.driver.response = b'x'
+            spicomm.transact(b'request')
+            self.assertEqual(0, spicomm.memory_stats().shrink_count)
+
+            time.sleep(0.02)
+            spicomm.transact(b'request')
+            stats = spicomm.memory_stats()
+            self.assertEqual(1, stats.shrink_count)
+            self.assertEqual(_spicomm.HEADER_SIZE + 1024, stats.buffer_size)
+
+    def test_spi_transport_reads_environment(self):
+        env = {'VISION_BONNET_INITIAL_PAYLOAD': '2048',
+               'VISION_BONNET_MAX_PAYLOAD': '4096',
+               'VISION_BONNET_SHRINK_AFTER': '-1'}
+        with mock.patch.dict(os.environ, env):
+            transport = _transport._SpiTransport()
+        self.driver.response = b'x' * 8192
+        with self.assertRaises(_spicomm.SpicommOverflowError):
+            transport.send(b'request')
+        self.assertEqual(_spicomm.HEADER_SIZE + 2048,
+                         transport.memory_stats().buffer_size)
+        self.assertIsNone(transport._spicomm._shrink_after)
+        transport.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the multi-object tracker."""
+
+import collections
+import random
+import unittest
+from unittest import mock
+
+from aiy.vision import tracker
+
+_Detection = collections.namedtuple('_Detection', ('bounding_box', 'kind'))
+
+
+def _detection(x, y, kind=None, size=50):
+    return _Detection((x, y, size, size), kind)
+
+
+class TrackerTest(unittest.TestCase):
+
+    def test_ids_are_stable_across_frames(self):
+        t = tracker.Tracker()
+        ids = None
+        for frame in range(10):
+            tracks = t.update([_detection(10 + 5 * frame, 10),
+                               _detection(300 - 5 * frame, 200)], timestamp=0.1 * frame)
+            frame_ids = sorted(track.id for track in tracks)
+            self.assertEqual(ids or frame_ids, frame_ids)
+            ids = frame_ids
+        self.assertEqual([1, 2], ids)
+        for track in t.tracks():
+            self.assertEqual(10, track.hits)
+            self.assertAlmostEqual(50.0, abs(track.velocity[0]))
+            self.assertAlmostEqual(0.0, track.velocity[1])
+
+    def test_kinds_are_not_matched(self):
+        t = tracker.Tracker()
+        first, = t.update([_detection(10, 10, kind=1)], timestamp=0.0)
+        second, = t.update([_detection(10, 10, kind=2)], timestamp=0.1)
+        self.assertNotEqual(first.id, second.id)
+        self.assertEqual(2, second.kind)
+        self.assertEqual(1, t.tracks()[0].misses)
+
+        third, = t.update([_detection(12, 10, kind=1)], timestamp=0.2)
+        self.assertEqual(first.id, third.id)
+
+    def test_tracks_expire_after_max_misses(self):
+        t = tracker.Tracker(max_misses=2)
+        track, = t.update([_detection(10, 10)], timestamp=0.0)
+        for frame in range(1, 3):
+            self.assertEqual([], t.update([], timestamp=0.1 * frame))
+            self.assertEqual([track.id], [live.id for live in t.tracks()])
+        t.update([], timestamp=0.3)
+        self.assertEqual([], t.tracks())
+
+        recreated, = t.update([_detection(10, 10)], timestamp=0.4)
+        self.assertNotEqual(track.id, recreated.id)
+
+    def test_missed_track_is_recovered(self):
+        t = tracker.Tracker(max_misses=2)
+        track, = t.update([_detection(10, 10)], timestamp=0.0)
+        t.update([], timestamp=0.1)
+        recovered, = t.update([_detection(12, 10)], timestamp=0.2)
+        self.assertEqual(track.id, recovered.id)
+        self.assertEqual(0, recovered.misses)
+
+    def test_min_hits(self):
+        t = tracker.Tracker(min_hits=2)
+        self.assertEqual([], t.update([_detection(10, 10)], timestamp=0.0))
+        self.assertEqual({}, t.predict(0.0))
+        track, = t.update([_detection(12, 10)], timestamp=0.1)
+        self.assertEqual(2, track.hits)
+
+
+@unittest.skipIf(tracker.np is None, 'NumPy is not installed.')
+class MatchingTest(unittest.TestCase):
+
+    def _random_boxes(self, rand, count):
+        return [(rand.randint(0, 200), rand.randint(0, 200),
+                 rand.randint(0, 60), rand.randint(0, 60)) for _ in range(count)]
+
+    def test_numpy_matches_python(self):
+        rand = random.Random(0)
+        for _ in range(200):
+            boxes1 = self._random_boxes(rand, rand.randint(1, 10))
+            boxes2 = self._random_boxes(rand, rand.randint(1, 10))
+            threshold = rand.choice((0.0, 0.1, 0.3))
+            ious = tracker._iou_matrix(boxes1, boxes2)
+            expected = tracker._greedy_match(ious, threshold)
+            with mock.patch.object(tracker, 'np', None):
+                py_ious = tracker._iou_matrix(boxes1, boxes2)
+                actual = tracker._greedy_match(py_ious, threshold)
+            for row, py_row in zip(ious.tolist(), py_ious):
+                for value, py_value in zip(row, py_row):
+                    self.assertAlmostEqual(value, py_value)
+            self.assertEqual(expected, actual)
+
+    def test_greedy_match_prefers_highest_iou(self):
+        ious = tracker.np.array([[0.5, 0.9],
+                                 [0.0, 0.6]])
+        self.assertEqual([(0, 1)], tracker._greedy_match(ious, 0.3))
+        with mock.patch.object(tracker, 'np', None):
+            self.assertEqual([(0, 1)], tracker._greedy_match(ious.tolist(), 0.3))
+
+
+if __name__ == '__main__':
+    unittest.main()